@@ -1,19 +1,44 @@
+"""Le Carb - LEarned CARdinality estimator Benchmark
+
+Usage:
+  lecarb workload gen [-s <seed>] [-d <dataset>] [-v <version>] [-w <workload>] [--params <params>] [--no-label] [--old-version <old_version>] [--win-ratio <win_ratio>] [--workers <workers>]
+  lecarb workload label [-d <dataset>] [-v <version>] [-w <workload>] [--workers <workers>] [--delta]
+  lecarb workload update-label [-s <seed>] [-d <dataset>] [-v <version>] [-w <workload>] [--sample-ratio <sample_ratio>]
+  lecarb workload merge [-d <dataset>] [-v <version>] [-w <workload>]
+  lecarb workload quicksel [-d <dataset>] [-v <version>] [-w <workload>] [--params <params>] [--overwrite]
+  lecarb workload dump [-d <dataset>] [-v <version>] [-w <workload>]
+  lecarb dataset table [-d <dataset>] [-v <version>] [--overwrite]
+  lecarb dataset gen [-s <seed>] [-d <dataset>] [-v <version>] [--params <params>] [--overwrite]
+  lecarb dataset update [-s <seed>] [-d <dataset>] [-v <version>] [--params <params>] [--overwrite]
+  lecarb dataset dump [-d <dataset>] [-v <version>]
+  lecarb test [-s <seed>] [-d <dataset>] [-v <version>] [-w <workload>] [-e <estimator>] [--params <params>] [--overwrite]
+  lecarb matrix [-s <seed>] [-d <dataset>] [--params <params>] [--overwrite]
+  lecarb report [-d <dataset>] [--params <params>]
+  lecarb report-dynamic [-d <dataset>] [--params <params>]
+  lecarb (-h | --help)
+
+Options:
+  -s, --seed <seed>                 Random seed.
+  -d, --dataset <dataset>           The input dataset [default: census13].
+  -v, --dataset-version <version>   Dataset version [default: original].
+  -w, --workload <workload>         Name of the workload [default: base].
+  -e, --estimator <estimator>       Name of the estimator [default: postgres].
+  --params <params>                 Parameters that are needed [default: {}].
+  --sample-ratio <sample_ratio>     Update query set with sample ratio [default: 0.05].
+  --old-version <old_version>       Generate queries on the data appended to the old version.
+  --win-ratio <win_ratio>           Ratio of the appended window to the old version size.
+  --workers <workers>               Number of processes used to generate workload shards and labels [default: 1].
+  --overwrite                       Whether overwrite the result.
+  --no-label                        Do not generate labels for the workload.
+  --delta                           Label an appended version from labels of its base version.
+  -h, --help                        Show this screen.
+"""
 from ast import literal_eval
 from time import time
 
 from docopt import docopt
 
-from .workload.gen_workload import generate_workload
-from .workload.gen_label import generate_labels, update_labels
-from .workload.merge_workload import merge_workload
-from .workload.dump_quicksel import dump_quicksel_query_files, generate_quicksel_permanent_assertions
-from .dataset.dataset import load_table, dump_table_to_num
-from .dataset.gen_dataset import generate_dataset
-from .dataset.manipulate_dataset import gen_appended_dataset
-from .estimator.postgres import test_postgres
-from .estimator.mysql import test_mysql
-from .estimator.utils import report_errors, report_dynamic_errors
-from .workload.workload import dump_sqls
+# each command only imports what it runs, database clients and torch take seconds to import
 
 if __name__ == "__main__":
     args = docopt(__doc__, version="Le Carb 0.1")
@@ -26,6 +51,7 @@ if __name__ == "__main__":
 
     if args["workload"]:
         if args["gen"]:
+            from .workload.gen_workload import generate_workload
             generate_workload(
                 seed,
                 dataset=args["--dataset"],
@@ -34,15 +60,20 @@ if __name__ == "__main__":
                 no_label = args["--no-label"],
                 old_version=args["--old-version"],
                 win_ratio=args["--win-ratio"],
-                params = literal_eval(args["--params"])
+                params = literal_eval(args["--params"]),
+                workers=int(args["--workers"])
             )
         elif args["label"]:
+            from .workload.gen_label import generate_labels
             generate_labels(
                 dataset=args["--dataset"],
                 version=args["--dataset-version"],
-                workload=args["--workload"]
+                workload=args["--workload"],
+                workers=int(args["--workers"]),
+                delta=args["--delta"]
             )
         elif args["update-label"]:
+            from .workload.gen_label import update_labels
             update_labels(
                 seed,
                 dataset=args["--dataset"],
@@ -51,12 +82,14 @@ if __name__ == "__main__":
                 sampling_ratio=literal_eval(args["--sample-ratio"])
             )
         elif args["merge"]:
+            from .workload.merge_workload import merge_workload
             merge_workload(
                 dataset=args["--dataset"],
                 version=args["--dataset-version"],
                 workload=args["--workload"]
             )
         elif args["quicksel"]:
+            from .workload.dump_quicksel import dump_quicksel_query_files, generate_quicksel_permanent_assertions
             dump_quicksel_query_files(
                 dataset=args["--dataset"],
                 version=args["--dataset-version"],
@@ -70,6 +103,7 @@ if __name__ == "__main__":
                 overwrite=args["--overwrite"]
             )
         elif args["dump"]:
+            from .workload.workload import dump_sqls
             dump_sqls(
                 dataset=args["--dataset"],
                 version=args["--dataset-version"],
@@ -80,8 +114,10 @@ if __name__ == "__main__":
 
     if args["dataset"]:
         if args["table"]:
+            from .dataset.dataset import load_table
             load_table(args["--dataset"], args["--dataset-version"], overwrite=args["--overwrite"])
         elif args["gen"]:
+            from .dataset.gen_dataset import generate_dataset
             generate_dataset(
                 seed,
                 dataset=args["--dataset"],
@@ -90,6 +126,7 @@ if __name__ == "__main__":
                 overwrite=args["--overwrite"]
             )
         elif args["update"]:
+            from .dataset.manipulate_dataset import gen_appended_dataset
             gen_appended_dataset(
                 seed,
                 dataset=args["--dataset"],
@@ -98,6 +135,7 @@ if __name__ == "__main__":
                 overwrite=args["--overwrite"]
             )
         elif args["dump"]:
+            from .dataset.dataset import dump_table_to_num
             dump_table_to_num(args["--dataset"], args["--dataset-version"])
         else:
             raise NotImplementedError
@@ -114,21 +152,33 @@ if __name__ == "__main__":
 
         
         if args["--estimator"] == "postgres":
+            from .estimator.postgres import test_postgres
             test_postgres(seed, dataset, version, workload, params, overwrite)
         elif args["--estimator"] == "mysql":
+            from .estimator.mysql import test_mysql
             test_mysql(seed, dataset, version, workload, params, overwrite)
+        elif args["--estimator"] == "pgstats":
+            from .estimator.pg_stats import test_pg_stats
+            test_pg_stats(seed, dataset, version, workload, params, overwrite)
         else:
             raise NotImplementedError
         exit(0)
 
+    if args["matrix"]:
+        from .estimator.matrix import test_matrix
+        test_matrix(seed, args["--dataset"], literal_eval(args["--params"]), args["--overwrite"])
+        exit(0)
+
     if args["report"]:
         dataset = args["--dataset"]
         params = literal_eval(args["--params"])
+        from .estimator.utils import report_errors
         report_errors(dataset, params['file'])
         exit(0)
     
     if args["report-dynamic"]:
         dataset = args["--dataset"]
         params = literal_eval(args["--params"])
+        from .estimator.utils import report_dynamic_errors
         report_dynamic_errors(dataset, params['old_new_file'], params['new_new_file'], params['T'], params['update_time'])
         exit(0)
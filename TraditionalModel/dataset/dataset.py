@@ -1,15 +1,17 @@
 import os
-import copy
+import hashlib
 import logging
 import pickle
 from collections import OrderedDict
+from pathlib import Path
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 
 import numpy as np
 import pandas as pd
-from sklearn.metrics import mutual_info_score
-from scipy.stats import entropy
 
-from ..constants import DATA_ROOT, PKL_PROTO
+from ..constants import DATA_ROOT, PKL_PROTO, NUM_THREADS
 from ..dtypes import is_categorical
 
 L = logging.getLogger(__name__)
@@ -39,6 +41,24 @@ class Column(object):
             vs = np.insert(vs, 0, np.nan)
         return vs, contains_nan
 
+    def vocab_digest(self):
+        """short fingerprint of the vocabulary, used to invalidate caches built on it"""
+        return hashlib.md5(pd.util.hash_array(np.asarray(self.vocab, dtype=object)).tobytes()).hexdigest()[:8]
+
+    def merge(self, other):
+        """Column over the union of both vocabularies, e.g. a table and the rows appended to it"""
+        data = pd.concat([pd.Series(self.vocab), pd.Series(other.vocab)], ignore_index=True)
+        if isinstance(self.dtype, pd.CategoricalDtype) and self.dtype == other.dtype:
+            data = data.astype(self.dtype)
+        return Column(self.name, data)
+
+    def restrict(self, present):
+        """Column over the part of the vocabulary marked in present, e.g. values appearing in a window of rows"""
+        data = pd.Series(self.vocab[present])
+        if isinstance(self.dtype, pd.CategoricalDtype):
+            data = data.astype(self.dtype)
+        return Column(self.name, data)
+
     def discretize(self, data):
         """Transforms data values into integers using a Column's vocabulary"""
 
@@ -74,25 +94,206 @@ class Column(object):
         val_norm = (data - minval) / (maxval - minval)
         return val_norm.astype(np.float32)
 
+    def decode(self, codes):
+        """Transforms integers back into data values, the inverse of discretize"""
+        if isinstance(self.dtype, pd.CategoricalDtype):
+            vals = self.vocab[1:] if self.has_nan else self.vocab
+            lookup = self.dtype.categories.get_indexer(vals)
+            if self.has_nan:
+                lookup = np.insert(lookup, 0, -1)
+            return pd.Categorical.from_codes(lookup[codes], dtype=self.dtype)
+        return self.vocab[codes].astype(self.dtype, copy=False)
+
+    def code_range(self, op, val):
+        """Transforms a predicate into the [low, high) range of codes whose values satisfy it"""
+        vals = self.vocab[1:] if self.has_nan else self.vocab
+        offset = int(self.has_nan)
+        # NaN/NaT literal never satisfies any comparison
+        if op == '[]':
+            if pd.isnull(val[0]) or pd.isnull(val[1]):
+                return offset, offset
+            low = np.searchsorted(vals, val[0], side='left')
+            high = np.searchsorted(vals, val[1], side='right')
+        elif pd.isnull(val):
+            return offset, offset
+        elif op == '=':
+            low = np.searchsorted(vals, val, side='left')
+            high = np.searchsorted(vals, val, side='right')
+        elif op == '>=':
+            low, high = np.searchsorted(vals, val, side='left'), len(vals)
+        elif op == '>':
+            low, high = np.searchsorted(vals, val, side='right'), len(vals)
+        elif op == '<=':
+            low, high = 0, np.searchsorted(vals, val, side='right')
+        elif op == '<':
+            low, high = 0, np.searchsorted(vals, val, side='left')
+        else:
+            raise NotImplementedError
+        return int(low) + offset, int(max(low, high)) + offset
+
+    def code_ranges(self, op, vals):
+        """vectorized code_range over an array of literals, vals is a pair of arrays for []"""
+        vocab_vals = self.vocab[1:] if self.has_nan else self.vocab
+        offset = int(self.has_nan)
+
+        def searchable(v):
+            # NaN literals cannot be compared with a vocab of strings, whatever the dtype of the literals
+            # their range is cleared below anyway
+            v = np.asarray(v)
+            isnull = pd.isnull(v)
+            if isnull.any() and len(vocab_vals) > 0:
+                v = v.astype(object) if vocab_vals.dtype == object else v.copy()
+                v[isnull] = vocab_vals[0]
+            return v
+
+        if op == '[]':
+            isnull = pd.isnull(vals[0]) | pd.isnull(vals[1])
+            vals = searchable(vals[0]), searchable(vals[1])
+            low = np.searchsorted(vocab_vals, vals[0], side='left')
+            high = np.searchsorted(vocab_vals, vals[1], side='right')
+        else:
+            isnull = pd.isnull(vals)
+            vals = searchable(vals)
+            if op == '=':
+                low = np.searchsorted(vocab_vals, vals, side='left')
+                high = np.searchsorted(vocab_vals, vals, side='right')
+            elif op == '>=':
+                low, high = np.searchsorted(vocab_vals, vals, side='left'), np.full(len(vals), len(vocab_vals))
+            elif op == '>':
+                low, high = np.searchsorted(vocab_vals, vals, side='right'), np.full(len(vals), len(vocab_vals))
+            elif op == '<=':
+                low, high = np.zeros(len(vals), dtype=np.int64), np.searchsorted(vocab_vals, vals, side='right')
+            elif op == '<':
+                low, high = np.zeros(len(vals), dtype=np.int64), np.searchsorted(vocab_vals, vals, side='left')
+            else:
+                raise NotImplementedError
+        high = np.maximum(low, high)
+        # NaN/NaT literal never satisfies any comparison
+        low = np.where(isnull, 0, low).astype(np.int64) + offset
+        high = np.where(isnull, 0, high).astype(np.int64) + offset
+        return low, high
+
 class Table(object):
+    # versions whose rows make up this table in order if it is assembled from segments, see append_table
+    segments = None
+    # version this table is appended to, its segments are a prefix of ours
+    base = None
+    # (table, start, end, code lookups) if this table is a view over rows [start, end) of another one, see window_table
+    window = None
+
     def __init__(self, dataset, version):
         self.dataset = dataset
         self.version = version
         self.name = f"{self.dataset}_{self.version}"
         L.info(f"start building data {self.name}...")
 
+        # directory of the columnar storage, None if the table is not backed by it
+        self.path = None
+        self._cache = {}
+
         # load data
-        self.data = pd.read_pickle(DATA_ROOT / self.dataset / f"{self.version}.pkl")
-        self.data_size_mb = self.data.values.nbytes / 1024 / 1024
-        self.row_num = self.data.shape[0]
-        self.col_num = len(self.data.columns)
+        self._data = pd.read_pickle(DATA_ROOT / self.dataset / f"{self.version}.pkl")
+        self.data_size_mb = self._data.values.nbytes / 1024 / 1024
+        self.row_num = self._data.shape[0]
+        self.col_num = len(self._data.columns)
 
         # parse columns
         self.parse_columns()
         L.info(f"build finished: {self}")
-    
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # data can be paged in again from the columnar storage
+        if self.path is not None:
+            state['_data'] = None
+            state['_cache'] = {}
+        return state
+
+    @property
+    def data(self):
+        if self._data is None:
+            L.info(f"page in all columns of {self.name}...")
+            self._data = pd.DataFrame(OrderedDict([(c, col.decode(self.codes(c))) for c, col in self.columns.items()]))
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # data is modified, detach from the columnar storage
+        self._data = data
+        self.row_num = data.shape[0]
+        self.path = None
+        self.segments = None
+        self.base = None
+        self.window = None
+        self._cache = {}
+
+    def codes(self, cname):
+        """discretized values of one column, memory-mapped if the table is backed by columnar storage"""
+        return self.column_array('codes', cname)
+
+    def digits(self, cname):
+        """digitalized values of one column: codes for categorical columns, values with NaN as 0 for the others"""
+        if is_categorical(self.columns[cname].dtype):
+            return self.codes(cname)
+        return self.column_array('digit', cname)
+
+    def normalized(self, cname):
+        """values of one column normalized to [0, 1], see Column.normalize"""
+        return self.column_array('norm', cname)
+
+    def sorted_index(self, cname):
+        """row ids ordered by codes of one column, rows of code range [low, high) are at the cumulative histogram offsets"""
+        return self.column_array('index', cname)
+
+    def column_array(self, kind, cname):
+        """per column arrays are built lazily from codes and persisted next to them (invalidated with the vocab)"""
+        key = (kind, cname)
+        if key not in self._cache:
+            # codes of segments are stored with the segments themselves, their merge is a derived cache of this version
+            segmented = kind == 'codes' and self.segments is not None
+            path = self.path / column_file(self, cname, 'merged' if segmented else kind) if self.path is not None else None
+            if path is not None and path.is_file():
+                self._cache[key] = np.load(path, mmap_mode='r')
+                return self._cache[key]
+
+            col = self.columns[cname]
+            if kind == 'codes' and self.window is not None:
+                # translate codes of the rows in window from the vocab of the viewed table to the restricted one
+                table, start, end, lookups = self.window
+                arr = lookups[cname][table.codes(cname)[start:end]]
+            elif segmented:
+                # translate codes of each segment from its own vocab to the merged one
+                arr = np.concatenate([col.discretize(seg.columns[cname].vocab)[seg.codes(cname)]
+                                      for seg in self.segment_tables()]).astype(np.min_scalar_type(col.vocab_size), copy=False)
+            elif kind == 'codes':
+                arr = col.discretize(self._data[cname])
+            elif kind == 'digit':
+                lookup = col.vocab.copy()
+                if col.has_nan:
+                    lookup[0] = 0
+                arr = lookup[self.codes(cname)]
+            elif kind == 'norm':
+                arr = col.normalize(col.vocab)[self.codes(cname)]
+            elif kind == 'index':
+                arr = np.argsort(self.codes(cname), kind='stable').astype(np.min_scalar_type(self.row_num), copy=False)
+            else:
+                raise NotImplementedError
+            if path is not None:
+                L.info(f"cache {kind} of column {cname} to {path}")
+                save_array(path, arr)
+                arr = np.load(path, mmap_mode='r')
+            self._cache[key] = arr
+        return self._cache[key]
+
+    def segment_tables(self):
+        key = ('segments', None)
+        if key not in self._cache:
+            self._cache[key] = [load_table(self.dataset, v) for v in self.segments]
+        return self._cache[key]
+
     def parse_columns(self):
         self.columns = OrderedDict([(col, Column(col, self.data[col])) for col in self.data.columns])
+        self._cache = {}
 
     def __repr__(self):
         return f"Table {self.name} ({self.row_num} rows, {self.data_size_mb:.2f}MB, columns:\n{os.linesep.join([repr(c) for c in self.columns.values()])})"
@@ -104,81 +305,241 @@ class Table(object):
         return minmax_dict
 
     def normalize(self, scale=1):
-        data = copy.deepcopy(self.data)
-        for cname, col in self.columns.items():
-            data[cname] = col.normalize(data[cname].values) * scale
-        return data
+        return pd.DataFrame(OrderedDict([(c, self.normalized(c) if scale == 1 else self.normalized(c) * scale)
+                                         for c in self.columns.keys()]), copy=False)
 
     def digitalize(self):
-        data = copy.deepcopy(self.data)
-        for cname, col in self.columns.items():
-            if is_categorical(col.dtype):
-                data[cname] = col.discretize(data[cname])
-            elif col.has_nan:
-                data[cname].fillna(0, inplace=True)
-        return data
-
-    def get_max_muteinfo_order(self):
+        return pd.DataFrame(OrderedDict([(c, self.digits(c)) for c in self.columns.keys()]), copy=False)
+
+    def get_max_muteinfo_order(self, workers=NUM_THREADS):
+        # scipy.stats is slow to import and not needed by anything else on a table
+        from scipy.stats import entropy
         order = []
 
         # find the first column with maximum entropy
         max_entropy = float('-inf')
         first_col = None
-        for c in self.columns.keys():
-            e = entropy(self.data[c].value_counts())
+        for c, col in self.columns.items():
+            e = entropy(np.bincount(self.codes(c), minlength=col.vocab_size))
             if e > max_entropy:
                 first_col = c
                 max_entropy = e
         assert first_col is not None, (first_col, max_entropy)
         order.append(first_col)
-        sep = '|'
-        chosen_data = self.data[first_col].astype(str) + sep
+        chosen_codes = np.asarray(self.codes(first_col), dtype=np.int64)
+        chosen_size = self.columns[first_col].vocab_size
 
         # add the rest columns one by one by choosing the max mutual information with existing columns
-        while len(order) < self.col_num:
-            max_muinfo = float('-inf')
-            next_col = None
-            for c in self.columns.keys():
-                if c in order: continue
-                m = mutual_info_score(chosen_data, self.data[c])
-                if m > max_muinfo:
-                    next_col = c
-                    max_muinfo = m
-            assert next_col is not None, (next_col, max_entropy)
-            order.append(next_col)
-            # concate new chosen columns
-            chosen_data = chosen_data + sep + self.data[next_col].astype(str)
-
-        return order, [self.data.columns.get_loc(c) for c in order]
-
-    def get_muteinfo(self, digital_data=None):
-        data = digital_data if digital_data is not None else self.digitalize()
-        muteinfo_dict = {}
-        for c1 in self.columns.keys():
-            muteinfo_dict[c1] = {}
-            for c2 in self.columns.keys():
-                if c1 != c2 and c2 in muteinfo_dict:
-                    assert c1 in muteinfo_dict[c2], muteinfo_dict.keys()
-                    muteinfo_dict[c1][c2] = muteinfo_dict[c2][c1]
-                else:
-                    muteinfo_dict[c1][c2] = mutual_info_score(data[c1], data[c2])
-        return pd.DataFrame().from_dict(muteinfo_dict)
+        with ThreadPoolExecutor(workers) as executor:
+            while len(order) < self.col_num:
+                candidates = [c for c in self.columns.keys() if c not in order]
+                # numpy releases the GIL in sorting and counting, so candidates are evaluated concurrently
+                muinfos = list(executor.map(
+                    lambda c: mutual_info_codes(chosen_codes, chosen_size, self.codes(c), self.columns[c].vocab_size),
+                    candidates))
+                next_col = candidates[int(np.argmax(muinfos))]
+                order.append(next_col)
+                # joint codes of chosen columns, factorized to keep them compact
+                chosen_codes, chosen_size = factorize_codes(chosen_codes, self.codes(next_col), self.columns[next_col].vocab_size)
+
+        columns = list(self.columns.keys())
+        return order, [columns.index(c) for c in order]
+
+    def get_muteinfo(self, digital_data=None, sample=None, seed=0, workers=NUM_THREADS):
+        """pairwise mutual information of columns, estimated on `sample` random rows if given"""
+        cache_path = self.path / f"muteinfo-{sample}-{seed}.pkl" if self.path is not None and digital_data is None else None
+        if cache_path is not None and cache_path.is_file():
+            L.info(f"load mutual information from {cache_path}")
+            return pd.read_pickle(cache_path)
+
+        row_ids = None
+        if sample is not None and sample < self.row_num:
+            row_ids = np.sort(np.random.RandomState(seed).choice(self.row_num, size=sample, replace=False))
+        codes = {}
+        sizes = {}
+        for c in self.columns.keys():
+            if digital_data is not None:
+                codes[c], uniques = pd.factorize(digital_data[c])
+                sizes[c] = len(uniques)
+            else:
+                codes[c] = self.codes(c)
+                sizes[c] = self.columns[c].vocab_size
+            if row_ids is not None:
+                codes[c] = np.asarray(codes[c][row_ids])
+            # workers map the columnar storage by themselves instead of receiving a copy
+            elif isinstance(codes[c], np.memmap) and codes[c].filename is not None:
+                codes[c] = str(codes[c].filename)
+
+        columns = list(self.columns.keys())
+        pairs = [(c1, c2) for i, c1 in enumerate(columns) for c2 in columns[i:]]
+        with Pool(workers, initializer=_init_muteinfo_worker, initargs=(codes, sizes)) as pool:
+            muinfos = pool.map(_pair_muteinfo, pairs)
+
+        muteinfo_dict = {c: {} for c in columns}
+        for (c1, c2), m in zip(pairs, muinfos):
+            muteinfo_dict[c1][c2] = m
+            muteinfo_dict[c2][c1] = m
+        muteinfo = pd.DataFrame().from_dict(muteinfo_dict)
+        if cache_path is not None:
+            muteinfo.to_pickle(cache_path, protocol=PKL_PROTO)
+        return muteinfo
+
+# column codes shared by the mutual information worker processes
+MUTEINFO_STATE = {}
+
+def _init_muteinfo_worker(codes, sizes):
+    MUTEINFO_STATE['codes'] = {c: np.load(v, mmap_mode='r') if isinstance(v, str) else v for c, v in codes.items()}
+    MUTEINFO_STATE['sizes'] = sizes
+
+def _pair_muteinfo(pair):
+    c1, c2 = pair
+    codes, sizes = MUTEINFO_STATE['codes'], MUTEINFO_STATE['sizes']
+    return mutual_info_codes(codes[c1], sizes[c1], codes[c2], sizes[c2])
+
+def save_array(path: Path, arr: np.ndarray) -> None:
+    """np.save through a temporary file, so that concurrent readers never map a partial file"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp_path, path)
+
+def factorize_codes(x: np.ndarray, y: np.ndarray, ny: int) -> Tuple[np.ndarray, int]:
+    """joint codes of two integer coded columns, renumbered to [0, number of distinct pairs)"""
+    uniques, joint = np.unique(x.astype(np.int64) * ny + y, return_inverse=True)
+    return joint.astype(np.int64), len(uniques)
+
+def mutual_info_codes(x: np.ndarray, nx: int, y: np.ndarray, ny: int) -> float:
+    """mutual information of two integer coded columns, same as sklearn's mutual_info_score on them"""
+    keys = np.asarray(x, dtype=np.int64) * ny + y
+    if nx * ny <= 4 * len(keys):
+        counts = np.bincount(keys, minlength=nx*ny)
+        cells = np.nonzero(counts)[0]
+        counts = counts[cells]
+    else:
+        cells, counts = np.unique(keys, return_counts=True)
+    total = len(keys)
+    px = np.bincount(x, minlength=nx)[cells // ny]
+    py = np.bincount(y, minlength=ny)[cells % ny]
+    mi = np.sum(counts / total * (np.log(counts) + np.log(total) - np.log(px) - np.log(py)))
+    return max(float(mi), 0.0)
+
+def column_file(table: Table, cname: str, kind: str='codes') -> str:
+    col_id = list(table.columns.keys()).index(cname)
+    if kind == 'codes':
+        return f"{col_id}.npy"
+    return f"{col_id}.{kind}.{table.columns[cname].vocab_digest()}.npy"
+
+def table_dir(dataset: str, version: str) -> Path:
+    return DATA_ROOT / dataset / f"{version}.table"
 
 def dump_table(table: Table) -> None:
-    with open(DATA_ROOT / table.dataset / f"{table.version}.table.pkl", 'wb') as f:
+    """dump table as one memory-mapped .npy file of codes per column, plus the metadata (vocab, Column) in meta.pkl"""
+    table_path = table_dir(table.dataset, table.version)
+    table_path.mkdir(exist_ok=True)
+    for cname, col in table.columns.items():
+        codes = table.codes(cname)
+        np.save(table_path / column_file(table, cname), codes.astype(np.min_scalar_type(col.vocab_size), copy=False))
+    dump_table_meta(table, table_path)
+
+def dump_table_meta(table: Table, table_path: Path) -> None:
+    # drop caches built on the previous dump
+    for f in list(table_path.glob("*.*.*.npy")) + list(table_path.glob("muteinfo-*.pkl")) + list(table_path.glob("cube.npy")):
+        f.unlink()
+    table.path = table_path
+    table._cache = {}
+    with open(table_path / "meta.pkl", 'wb') as f:
         pickle.dump(table, f, protocol=PKL_PROTO)
 
+def create_table(dataset: str, version: str, columns: OrderedDict, row_num: int,
+                 segments: List[str]=None, base: str=None) -> Table:
+    """create table over codes that are already written to its columnar storage (or to its segments), without loading any data"""
+    table = Table.__new__(Table)
+    table.segments = segments
+    table.base = base
+    table.dataset = dataset
+    table.version = version
+    table.name = f"{dataset}_{version}"
+    table._data = None
+    table.columns = columns
+    table.row_num = row_num
+    table.col_num = len(columns)
+    # same as nbytes of DataFrame.values, where every cell takes 8 bytes
+    table.data_size_mb = row_num * len(columns) * 8 / 1024 / 1024
+    table_path = table_dir(dataset, version)
+    table_path.mkdir(exist_ok=True)
+    dump_table_meta(table, table_path)
+    L.info(f"create finished: {table}")
+    return table
+
+def append_table(dataset: str, version: str, base_version: str, segment: str, delta: pd.DataFrame) -> Table:
+    """create version as rows of base_version followed by delta, only delta is stored as a new segment"""
+    L.info(f"store {len(delta)} appended rows as segment {segment}")
+    delta.to_pickle(DATA_ROOT / dataset / f"{segment}.pkl", protocol=PKL_PROTO)
+    seg = load_table(dataset, segment, overwrite=True)
+
+    base = load_table(dataset, base_version)
+    segments = (base.segments or [base_version]) + [segment]
+    columns = OrderedDict([(c, col.merge(seg.columns[c])) for c, col in base.columns.items()])
+    return create_table(dataset, version, columns, base.row_num + seg.row_num, segments=segments, base=base_version)
+
+def window_table(table: Table, start: int, end: int=None) -> Table:
+    """view over rows [start, end) of table without copying any data, vocab of each column is restricted to the window"""
+    end = table.row_num if end is None else end
+    view = Table.__new__(Table)
+    view.dataset = table.dataset
+    view.version = table.version
+    view.name = table.name
+    view.path = None
+    view._cache = {}
+    view._data = None
+    columns, lookups = OrderedDict(), {}
+    for c, col in table.columns.items():
+        present = np.bincount(table.codes(c)[start:end], minlength=col.vocab_size) > 0
+        columns[c] = col.restrict(present)
+        lookups[c] = (np.cumsum(present) - 1).astype(np.min_scalar_type(columns[c].vocab_size), copy=False)
+    view.columns = columns
+    view.window = (table, start, end, lookups)
+    view.row_num = end - start
+    view.col_num = len(columns)
+    view.data_size_mb = view.row_num * view.col_num * 8 / 1024 / 1024
+    L.info(f"window [{start}, {end}) of {table.name}: {view}")
+    return view
+
+def open_table(table_path: Path) -> Table:
+    """open table from columnar storage, columns are only paged in when used"""
+    with open(table_path / "meta.pkl", 'rb') as f:
+        table = pickle.load(f)
+    table.path = table_path
+    table._cache = {}
+    return table
+
 def load_table(dataset: str, version: str, overwrite: bool=False) -> Table:
-    table_path = DATA_ROOT / dataset / f"{version}.table.pkl"
+    table_path = table_dir(dataset, version)
+    legacy_path = DATA_ROOT / dataset / f"{version}.table.pkl"
 
-    if not overwrite and table_path.is_file():
-        L.info("table exists, load...")
-        with open(table_path, 'rb') as f:
-            table = pickle.load(f)
-        L.info(f"load finished: {table}")
+    if not overwrite and (table_path / "meta.pkl").is_file():
+        L.info("table exists, open...")
+        table = open_table(table_path)
+        L.info(f"open finished: {table.name} ({table.row_num} rows, {table.col_num} columns)")
         return table
 
-    table = Table(dataset, version)
+    if not overwrite and legacy_path.is_file():
+        L.info("pickled table exists, load and convert to columnar storage...")
+        with open(legacy_path, 'rb') as f:
+            table = pickle.load(f)
+        # tables pickled before columnar storage keep data in the plain attribute
+        if 'data' in table.__dict__:
+            table._data = table.__dict__.pop('data')
+            table.path = None
+            table._cache = {}
+    elif not (DATA_ROOT / dataset / f"{version}.pkl").is_file() and (table_path / "meta.pkl").is_file():
+        # versions generated in chunks or assembled from segments only live in the columnar storage
+        L.info("no pickled data to rebuild from, drop caches built on the columnar storage...")
+        table = open_table(table_path)
+        dump_table_meta(table, table_path)
+        return table
+    else:
+        table = Table(dataset, version)
     L.info("dump table to disk...")
     dump_table(table)
     return table
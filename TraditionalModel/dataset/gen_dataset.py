@@ -1,11 +1,11 @@
-import random
 import logging
 import numpy as np
 import pandas as pd
 from scipy.stats import truncnorm, truncexpon, genpareto
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 
-from .dataset import load_table
+from .dataset import Column, create_table, load_table, table_dir
 from ..constants import DATA_ROOT
 
 L = logging.getLogger(__name__)
@@ -16,10 +16,68 @@ def get_truncated_normal(mean=0, sd=100, low=0, upp=1000):
 def get_truncated_expon(scale=100, low=0, upp=1000):
     return truncexpon(b=(upp-low)/scale, loc=low, scale=scale)
 
+def source_columns(col_num: int, corr_mode: str) -> List[Optional[int]]:
+    """the column each column is correlated with, None for columns drawn independently by skew
+    chain: col0 <- col1 <- col2 ...
+    pair: (col0 <- col1), (col2 <- col3), ...
+    """
+    if corr_mode == 'chain':
+        return [None] + list(range(col_num - 1))
+    if corr_mode == 'pair':
+        return [None if i % 2 == 0 else i - 1 for i in range(col_num)]
+    raise NotImplementedError(corr_mode)
+
+def skewed_chunk(rng, skew: float, start: int, end: int, dom: int) -> np.ndarray:
+    """raw generalized pareto draws of rows [start, end), the first dom rows are reserved for the full domain"""
+    size = max(0, end - max(start, dom))
+    return genpareto.rvs(skew-1, size=size, random_state=rng) # c = skew - 1, so we can have c >= 0
+
+def generate_chunk(seed: int, chunk_id: int, start: int, end: int, params: Dict[str, Any],
+                   sources: List[Optional[int]], bounds: Optional[List[Tuple[float, float]]]=None
+                   ) -> Tuple[Optional[List[np.ndarray]], List[Tuple[float, float]]]:
+    """generate rows [start, end), return columns and min/max of the raw skewed draws
+    each chunk has its own derived seed so it can be regenerated without the others
+    """
+    dom = params['dom']
+    corr = params['corr']
+    rng = np.random.default_rng([seed, chunk_id])
+
+    # all skewed columns are drawn first, so the first pass sees the same draws without generating the rest
+    raws = [skewed_chunk(rng, params['skew'], start, end, dom) if src is None else None for src in sources]
+    chunk_bounds = [(tmp.min(), tmp.max()) if len(tmp) > 0 else (np.inf, -np.inf) for tmp in raws if tmp is not None]
+    if bounds is None:
+        return None, chunk_bounds
+
+    cols = []
+    skewed_id = 0
+    for src, tmp in zip(sources, raws):
+        if src is None:
+            # generate the column according to skew
+            low, high = bounds[skewed_id]
+            tmp = ((tmp - low) / (high - low)) * dom # rescale generated data to the range of domain
+            head = np.arange(min(start, dom), min(end, dom)) # make sure every domain value has at least 1 value
+            if skewed_id > 0:
+                # shuffle the domain rows of other skewed columns, otherwise they are all equal to col0
+                head = np.random.default_rng([seed, 0, skewed_id]).permutation(dom)[head]
+            skewed_id += 1
+            cols.append(np.concatenate((head, np.clip(tmp.astype(int), 0, dom-1))))
+        else:
+            # generate the column according to its source column
+            n = end - start
+            cols.append(np.where(rng.uniform(0, 1, size=n) <= corr, cols[src], rng.integers(dom, size=n)))
+    return cols, chunk_bounds
+
 def generate_dataset(
     seed: int, dataset: str, version: str,
     params: Dict[str, Any], overwrite: bool
 ) -> None:
+    """
+    params:
+        row_num, col_num, dom, corr, skew
+        corr_mode: chain (default) or pair, see source_columns
+        chunk_size: rows generated at a time (default 10M), tables with more rows skip {version}.pkl and
+            are written to columnar storage directly
+    """
     path = DATA_ROOT / dataset
     path.mkdir(exist_ok=True)
     csv_path = path / f"{version}.csv"
@@ -31,33 +89,56 @@ def generate_dataset(
     row_num = params['row_num']
     col_num = params['col_num']
     dom = params['dom']
-    corr = params['corr']
-    skew = params['skew']
-
-    if col_num != 2:
-        L.info("For now only support col=2!")
-        exit(0)
+    chunk_size = params.get('chunk_size', 10_000_000)
+    sources = source_columns(col_num, params.get('corr_mode', 'chain'))
+    names = [f"col{i}" for i in range(col_num)]
+    assert row_num >= dom, "need at least one row per domain value"
 
     L.info(f"Start generate dataset with {col_num} columns and {row_num} rows using seed {seed}")
-    random.seed(seed)
-    np.random.seed(seed)
-
-    # generate the first column according to skew
-    col0 = np.arange(dom) # make sure every domain value has at least 1 value
-    tmp = genpareto.rvs(skew-1, size=row_num-len(col0)) # c = skew - 1, so we can have c >= 0
-    tmp = ((tmp - tmp.min()) / (tmp.max() - tmp.min())) * dom # rescale generated data to the range of domain
-    col0 = np.concatenate((col0, np.clip(tmp.astype(int), 0, dom-1)))
-
-    # generate the second column according to the first
-    col1 = []
-    for c0 in col0:
-        col1.append(c0 if np.random.uniform(0, 1) <= corr else np.random.choice(dom))
-
-    df = pd.DataFrame(data={'col0': col0, 'col1': col1})
-
-    L.info(f"Dump dataset {dataset} as version {version} to disk")
-    df.to_csv(csv_path, index=False)
-    df.to_pickle(pkl_path)
-    load_table(dataset, version)
-    L.info(f"Finish!")
+    chunks = [(start, min(start + chunk_size, row_num)) for start in range(0, row_num, chunk_size)]
 
+    # first pass: the rescaling of skewed columns needs global min/max of the raw draws
+    bounds = None
+    for chunk_id, (start, end) in enumerate(chunks):
+        _, chunk_bounds = generate_chunk(seed, chunk_id, start, end, params, sources)
+        bounds = chunk_bounds if bounds is None else \
+                [(min(l0, l1), max(h0, h1)) for (l0, h0), (l1, h1) in zip(bounds, chunk_bounds)]
+
+    if len(chunks) == 1:
+        cols, _ = generate_chunk(seed, 0, 0, row_num, params, sources, bounds)
+        df = pd.DataFrame(data=OrderedDict(zip(names, cols)))
+        L.info(f"Dump dataset {dataset} as version {version} to disk")
+        df.to_csv(csv_path, index=False)
+        df.to_pickle(pkl_path)
+        load_table(dataset, version, overwrite=True)
+        L.info(f"Finish!")
+        return
+
+    # second pass: stream chunks to csv, values go to the columnar storage and are turned into codes later
+    L.info(f"Dump dataset {dataset} as version {version} to disk in {len(chunks)} chunks, no {pkl_path.name} is written")
+    table_path = table_dir(dataset, version)
+    table_path.mkdir(exist_ok=True)
+    files = [np.lib.format.open_memmap(table_path / f"{i}.npy", mode='w+', dtype=np.min_scalar_type(dom), shape=(row_num,))
+             for i in range(col_num)]
+    present = np.zeros((col_num, dom), dtype=bool)
+    for chunk_id, (start, end) in enumerate(chunks):
+        cols, _ = generate_chunk(seed, chunk_id, start, end, params, sources, bounds)
+        for i, col in enumerate(cols):
+            files[i][start:end] = col
+            present[i, col] = True
+        pd.DataFrame(data=OrderedDict(zip(names, cols))).to_csv(csv_path, mode='w' if chunk_id == 0 else 'a', header=chunk_id == 0, index=False)
+        L.info(f"{end}/{row_num} rows generated")
+
+    columns = OrderedDict()
+    for i, name in enumerate(names):
+        vocab = np.flatnonzero(present[i])
+        # values are codes already unless some domain values never appear
+        if len(vocab) < dom:
+            lookup = np.cumsum(present[i]) - 1
+            for start, end in chunks:
+                files[i][start:end] = lookup[files[i][start:end]]
+        files[i].flush()
+        columns[name] = Column(name, vocab)
+    del files
+    create_table(dataset, version, columns, row_num)
+    L.info(f"Finish!")
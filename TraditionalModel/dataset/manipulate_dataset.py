@@ -1,6 +1,7 @@
 import random
 import logging
 import pickle
+import shutil
 import numpy as np
 import math
 import pandas as pd
@@ -8,11 +9,18 @@ from scipy.stats import truncnorm, truncexpon, genpareto
 from typing import Dict, Any, Tuple
 from copy import deepcopy
 
-from .dataset import load_table
+from .dataset import append_table, load_table
 from ..constants import DATA_ROOT, PKL_PROTO
 
 L = logging.getLogger(__name__)
 
+def read_data(dataset: str, version: str) -> pd.DataFrame:
+    """rows of a version, versions without a pickle (generated in chunks or appended) are decoded from their table"""
+    pkl_path = DATA_ROOT / dataset / f"{version}.pkl"
+    if pkl_path.is_file():
+        return pd.read_pickle(pkl_path)
+    return load_table(dataset, version).data
+
 # Independence data: Random by each column
 def get_random_data(dataset: str, version: str, overwrite=False) -> Tuple[pd.DataFrame, str]:
     rand_version = f"{version}_ind"
@@ -21,7 +29,7 @@ def get_random_data(dataset: str, version: str, overwrite=False) -> Tuple[pd.Dat
         L.info(f"Dataset path exists, using it")
         return pd.read_pickle(random_file), rand_version
     
-    df = pd.read_pickle(DATA_ROOT / dataset / f"{version}.pkl")
+    df = read_data(dataset, version)
     for col in df.columns:
         df[col] = df[col].sample(frac=1).reset_index(drop=True)
     pd.to_pickle(df, random_file, protocol=PKL_PROTO)
@@ -34,7 +42,7 @@ def get_sorted_data(dataset: str, version: str, overwrite=False) -> Tuple[pd.Dat
     if not overwrite and sorted_file.is_file():
         return pd.read_pickle(sorted_file), sort_version
     
-    df = pd.read_pickle(DATA_ROOT / dataset / f"{version}.pkl")
+    df = read_data(dataset, version)
     for col in df.columns:
         df[col] = df[col].sort_values().reset_index(drop=True)
     df = df.sample(frac=1).reset_index(drop=True)
@@ -48,7 +56,7 @@ def get_skew_data(dataset: str = 'census', version: str = 'original', sample_rat
     if not overwrite and skew_file.is_file():
         return pd.read_pickle(skew_file), skew_version
     
-    df = pd.read_pickle(DATA_ROOT / dataset / f"{version}.pkl")
+    df = read_data(dataset, version)
 
 
     rank_df = pd.DataFrame(0.0, index=range(len(df)), columns=['rank_sum']).astype(np.float32)
@@ -63,19 +71,31 @@ def get_skew_data(dataset: str = 'census', version: str = 'original', sample_rat
 
 
 
+def dump_appended_csv(dataset: str, version: str, version_target: str, delta: pd.DataFrame) -> None:
+    """csv loaded into the databases for version: the csv of version_target followed by the appended rows"""
+    csv_path = DATA_ROOT / dataset / f"{version}.csv"
+    base_csv = DATA_ROOT / dataset / f"{version_target}.csv"
+    L.info(f"dump csv file to {csv_path}")
+    if base_csv.is_file():
+        shutil.copyfile(base_csv, csv_path)
+    else:
+        load_table(dataset, version_target).data.to_csv(csv_path, index=False)
+    delta.to_csv(csv_path, mode='a', header=False, index=False)
+
 def append_data(dataset: str, version_target: str, version_from: str, interval=0.2):
-    df_target = pd.read_pickle(DATA_ROOT / dataset / f"{version_target}.pkl")
-    df_from = pd.read_pickle(DATA_ROOT / dataset / f"{version_from}.pkl")
+    """the new version is stored as segments: rows of version_target plus the appended rows, which are stored only once"""
+    df_from = read_data(dataset, version_from)
 
     row_num = len(df_from)
     l = 0
     r = l + interval
     if r <= 1:
         L.info(f"Start appending {version_target} with {version_from} in [{l}, {r}]")
-        df_target = df_target.append(df_from[int(l*row_num): int(r*row_num)], ignore_index=True, sort=False)
-        pd.to_pickle(df_target, DATA_ROOT / dataset / f"{version_target}+{version_from}_{r:.1f}.pkl")
-        df_target.to_csv(DATA_ROOT / dataset / f"{version_target}+{version_from}_{r:.1f}.csv", index=False)
-        load_table(dataset, f"{version_target}+{version_from}_{r:.1f}")
+        segment = f"{version_from}_{l:.1f}-{r:.1f}"
+        delta = df_from[int(l*row_num): int(r*row_num)].reset_index(drop=True)
+        version = f"{version_target}+{version_from}_{r:.1f}"
+        append_table(dataset, version, version_target, segment, delta)
+        dump_appended_csv(dataset, version, version_target, delta)
     else:
         L.info(f"Appending Fail! Batch size is too big!")
 
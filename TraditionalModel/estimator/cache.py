@@ -0,0 +1,75 @@
+import os
+import pickle
+import hashlib
+import logging
+from typing import Any, List, Tuple
+import numpy as np
+
+from .estimator import Estimator
+from ..workload.workload import Query, Sharded, take
+from ..constants import RESULT_ROOT, PKL_PROTO
+
+L = logging.getLogger(__name__)
+
+def _canonical(val: Any) -> Any:
+    if isinstance(val, tuple):
+        return tuple(_canonical(v) for v in val)
+    # numpy scalars and python scalars with the same value share one fingerprint
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+def query_fingerprint(query: Query) -> str:
+    preds = sorted((c, p[0], _canonical(p[1])) for c, p in query.predicates.items() if p is not None)
+    return hashlib.sha1(repr(preds).encode()).hexdigest()
+
+def data_fingerprint(table) -> str:
+    """short fingerprint of the data an estimator is built on, so a regenerated version does not reuse stale estimates"""
+    digests = [str(table.row_num)] + [col.vocab_digest() for col in table.columns.values()]
+    return hashlib.sha1(' '.join(digests).encode()).hexdigest()[:8]
+
+class EstimateCache(object):
+    """On-disk estimates of one estimator config on one data version, keyed by query fingerprint
+    refresh: ignore estimates already on disk, they are replaced by the new ones
+    """
+    def __init__(self, dataset: str, estimator: Estimator, refresh: bool=False) -> None:
+        self.path = RESULT_ROOT / dataset / "cache" / f"{estimator.table.version}-{data_fingerprint(estimator.table)}-{estimator}.pkl"
+        self.estimates = {}
+        if not refresh and self.path.is_file():
+            with open(self.path, 'rb') as f:
+                self.estimates = pickle.load(f)
+            L.info(f"Load {len(self.estimates)} cached estimates from {self.path}")
+
+    def dump(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.estimates, f, protocol=PKL_PROTO)
+        os.replace(tmp_path, self.path)
+
+    def query_batch(self, estimator: Estimator, queries: List[Query], dump: bool=True) -> Tuple[np.ndarray, np.ndarray]:
+        """same as estimator.query_batch, but only queries never seen before hit the estimator"""
+        if isinstance(queries, Sharded):
+            # one shard of queries at a time, new estimates are dumped once at the end
+            size = len(self.estimates)
+            results = [self.query_batch(estimator, shard, dump=False) for shard in queries.shards()]
+            if len(self.estimates) > size:
+                self.dump()
+            return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+        fps = [query_fingerprint(q) for q in queries]
+        missing = {}
+        for i, fp in enumerate(fps):
+            if fp not in self.estimates and fp not in missing:
+                missing[fp] = i
+        L.info(f"{len(queries) - len(missing)} of {len(queries)} queries are answered by cache")
+
+        if len(missing) > 0:
+            est_cards, dur_ms = estimator.query_batch(take(queries, list(missing.values())))
+            for fp, est_card, dur in zip(missing.keys(), est_cards, dur_ms):
+                self.estimates[fp] = (float(est_card), float(dur))
+            if dump:
+                self.dump()
+
+        results = np.array([self.estimates[fp] for fp in fps], dtype=np.float64).reshape(-1, 2)
+        return results[:, 0], results[:, 1]
@@ -1,9 +1,13 @@
 import time
 import logging
+import tempfile
+from collections import OrderedDict
+from multiprocessing import Pool
 import numpy as np
-from typing import Tuple, Any
-from ..workload.workload import Query, query_2_triple
-from ..dataset.dataset import Table
+from typing import Tuple, Any, Dict, List, Optional
+from ..workload.workload import Query, query_2_triple, query_2_ranges, queries_2_ranges, as_query_array
+from ..dataset.dataset import Table, save_array
+from ..constants import DATA_ROOT
 
 L = logging.getLogger(__name__)
 
@@ -21,6 +25,14 @@ class Estimator(object):
         """return est_card, dur_ms"""
         raise NotImplementedError
 
+    def query_batch(self, queries: List[Query]) -> Tuple[np.ndarray, np.ndarray]:
+        """return est_cards, dur_ms of all queries in order"""
+        est_cards = np.zeros(len(queries), dtype=np.float64)
+        dur_ms = np.zeros(len(queries), dtype=np.float64)
+        for i, q in enumerate(queries):
+            est_cards[i], dur_ms[i] = self.query(q)
+        return est_cards, dur_ms
+
 def in_between(data: Any, val: Tuple[Any, Any]) -> bool:
     assert len(val) == 2
     lrange, rrange = val
@@ -35,16 +47,208 @@ OPS = {
     '[]': in_between
 }
 
+class MaskCache(object):
+    """LRU cache of predicate bitmaps keyed by (column, low, high) code range"""
+    def __init__(self, codes: Dict[str, np.ndarray], row_num: int, cache_mb: float) -> None:
+        self.codes = codes
+        self.capacity = max(1, int(cache_mb * 1024 * 1024 / max(row_num, 1)))
+        self.masks = OrderedDict()
+
+    def get(self, col: str, low: int, high: int) -> np.ndarray:
+        key = (col, low, high)
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.masks.move_to_end(key)
+            return mask
+        codes = self.codes[col]
+        mask = np.greater_equal(codes, low)
+        mask &= np.less(codes, high)
+        self.masks[key] = mask
+        if len(self.masks) > self.capacity:
+            self.masks.popitem(last=False)
+        return mask
+
+# use sorted index when the most selective predicate keeps less than 1/INDEX_RATIO of the rows,
+# otherwise random access to its rows costs more than scanning the columns
+INDEX_RATIO = 10
+
+def count_ranges(
+    codes: Dict[str, np.ndarray], hists: Dict[str, np.ndarray], row_num: int,
+    ranges: List[Optional[List[Tuple[str, int, int]]]], cache_mb: float=1024,
+    index: Optional[Dict[str, np.ndarray]]=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """count rows satisfying each query given as code ranges (see query_2_ranges), return cards, dur_ms
+    hists: column -> cumulative code histogram with a leading 0, used to answer single predicate directly
+    index: column -> row ids sorted by code (see Table.sorted_index), used for selective conjunctions
+    """
+    cache = MaskCache(codes, row_num, cache_mb)
+    cards = np.zeros(len(ranges), dtype=np.int64)
+    dur_ms = np.zeros(len(ranges), dtype=np.float64)
+    for i, rs in enumerate(ranges):
+        start_stmp = time.time()
+        if rs is None:
+            card = 0
+        elif len(rs) == 0:
+            card = row_num
+        elif len(rs) == 1:
+            c, low, high = rs[0]
+            card = hists[c][high] - hists[c][low]
+        else:
+            # start from the most selective predicate
+            rs = sorted(rs, key=lambda r: hists[r[0]][r[2]] - hists[r[0]][r[1]])
+            c, low, high = rs[0]
+            if index is not None and (hists[c][high] - hists[c][low]) * INDEX_RATIO < row_num:
+                # check the rest predicates only on rows satisfying the most selective one
+                rows = np.sort(index[c][hists[c][low]:hists[c][high]])
+                for c, low, high in rs[1:]:
+                    vals = codes[c][rows]
+                    rows = rows[(vals >= low) & (vals < high)]
+                card = len(rows)
+            else:
+                bitmap = cache.get(*rs[0]).copy()
+                for r in rs[1:]:
+                    bitmap &= cache.get(*r)
+                card = np.count_nonzero(bitmap)
+        cards[i] = card
+        dur_ms[i] = (time.time() - start_stmp) * 1e3
+    return cards, dur_ms
+
+# column codes shared by the labeling worker processes
+WORKER_STATE = {}
+
+def _init_worker(code_files, hists, row_num, cache_mb, index_files):
+    WORKER_STATE['codes'] = {c: np.load(f, mmap_mode='r') for c, f in code_files.items()}
+    WORKER_STATE['hists'] = hists
+    WORKER_STATE['row_num'] = row_num
+    WORKER_STATE['cache_mb'] = cache_mb
+    WORKER_STATE['index'] = {c: np.load(f, mmap_mode='r') for c, f in index_files.items()} if index_files is not None else None
+
+def _count_shard(ranges):
+    return count_ranges(WORKER_STATE['codes'], WORKER_STATE['hists'], WORKER_STATE['row_num'],
+                        ranges, WORKER_STATE['cache_mb'], WORKER_STATE['index'])
+
+def _shared_files(arrays: Dict[str, np.ndarray], tmp_dir: str, prefix: str) -> Dict[str, str]:
+    """files the worker processes map arrays from"""
+    files = {}
+    for i, (c, v) in enumerate(arrays.items()):
+        # columns from the columnar table storage are already on disk
+        if isinstance(v, np.memmap) and v.filename is not None:
+            files[c] = v.filename
+            continue
+        files[c] = f"{tmp_dir}/{prefix}{i}.npy"
+        np.save(files[c], v)
+    return files
+
+def count_ranges_parallel(
+    codes: Dict[str, np.ndarray], hists: Dict[str, np.ndarray], row_num: int,
+    ranges: List[Optional[List[Tuple[str, int, int]]]], workers: int,
+    cache_mb: float=1024, tmp_root: Optional[str]=None, index: Optional[Dict[str, np.ndarray]]=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """same as count_ranges, but count query shards in a pool of processes sharing memory-mapped column codes"""
+    shard_size = max(1, -(-len(ranges) // (workers * 4)))
+    shards = [ranges[i:i+shard_size] for i in range(0, len(ranges), shard_size)]
+    with tempfile.TemporaryDirectory(dir=tmp_root) as tmp_dir:
+        code_files = _shared_files(codes, tmp_dir, 'codes')
+        index_files = _shared_files(index, tmp_dir, 'index') if index is not None else None
+        with Pool(workers, initializer=_init_worker, initargs=(code_files, hists, row_num, cache_mb / workers, index_files)) as pool:
+            # imap keeps the order of shards, so the output is deterministic
+            results = list(pool.imap(_count_shard, shards))
+    if len(results) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+class PrefixCube(object):
+    """summed-area table over the codes of all columns, counts any box of code ranges in 2^ncols lookups"""
+    def __init__(self, table: Table) -> None:
+        self.path = table.path / "cube.npy" if table.path is not None else None
+        if self.path is not None and self.path.is_file():
+            L.info(f"load prefix-sum cube from {self.path}")
+            self.cube = np.load(self.path, mmap_mode='r')
+            return
+
+        start_stmp = time.time()
+        shape = tuple(col.vocab_size for col in table.columns.values())
+        cells = np.ravel_multi_index([np.asarray(table.codes(c), dtype=np.int64) for c in table.columns.keys()], shape)
+        cube = np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+        # leading 0 on every dimension, so that cube[high] - cube[low] needs no boundary check
+        cube = np.pad(cube, [(1, 0)] * len(shape))
+        for axis in range(len(shape)):
+            np.cumsum(cube, axis=axis, out=cube)
+        self.cube = cube
+        L.info(f"build prefix-sum cube of shape {shape} in {time.time() - start_stmp:.2f} seconds")
+        if self.path is not None:
+            save_array(self.path, cube)
+
+    @staticmethod
+    def size_mb(table: Table) -> float:
+        return np.prod([col.vocab_size + 1 for col in table.columns.values()], dtype=np.float64) * 8 / 1024 / 1024
+
+    def count(self, lows: np.ndarray, highs: np.ndarray) -> np.ndarray:
+        """count rows in each box given by (query, column) [low, high) code ranges, by inclusion-exclusion of its corners"""
+        ndim = lows.shape[1]
+        cards = np.zeros(len(lows), dtype=np.int64)
+        for corner in range(1 << ndim):
+            bits = [(corner >> d) & 1 for d in range(ndim)]
+            idx = tuple(highs[:, d] if b else lows[:, d] for d, b in enumerate(bits))
+            sign = 1 if (ndim - sum(bits)) % 2 == 0 else -1
+            cards += sign * self.cube[idx]
+        return cards
+
+class SortedIndex(dict):
+    """sorted index of columns, each one is only built (or loaded) when a selective predicate first needs it"""
+    def __init__(self, table: Table) -> None:
+        super(SortedIndex, self).__init__()
+        self.table = table
+
+    def __missing__(self, c: str) -> np.ndarray:
+        self[c] = self.table.sorted_index(c)
+        return self[c]
+
 class Oracle(Estimator):
-    def __init__(self, table):
+    def __init__(self, table, cache_mb=1024, workers=1, cube_mb=256, index=True):
         super(Oracle, self).__init__(table=table)
+        self.cache_mb = cache_mb
+        self.workers = workers
+        self.codes = {}
+        self.hists = {}
+        self.index = SortedIndex(table) if index else None
+        # tables with small domains are answered by a prefix-sum cube
+        self.cube = PrefixCube(table) if PrefixCube.size_mb(table) <= cube_mb else None
+
+    def prepare(self, columns):
+        """discretize the given columns once and build their cumulative histograms"""
+        for c in columns:
+            if c in self.codes:
+                continue
+            col = self.table.columns[c]
+            self.codes[c] = self.table.codes(c)
+            self.hists[c] = np.concatenate(([0], np.cumsum(np.bincount(self.codes[c], minlength=col.vocab_size))))
+
+    def query_batch(self, queries):
+        if self.cube is not None:
+            start_stmp = time.time()
+            lows, highs = as_query_array(queries, list(self.table.columns.keys())).code_ranges(self.table)
+            cards = self.cube.count(lows, highs)
+            return cards, np.full(len(cards), (time.time() - start_stmp) * 1e3 / max(len(cards), 1))
+
+        ranges = queries_2_ranges(queries, self.table)
+        self.prepare(set(r[0] for rs in ranges if rs for r in rs))
+        if self.workers > 1:
+            L.info(f"Count {len(ranges)} queries with {self.workers} workers")
+            return count_ranges_parallel(self.codes, self.hists, self.table.row_num, ranges, self.workers,
+                                         self.cache_mb, tmp_root=DATA_ROOT / self.table.dataset,
+                                         # worker processes map the index of all columns in advance
+                                         index={c: self.index[c] for c in self.codes} if self.index is not None else None)
+        return count_ranges(self.codes, self.hists, self.table.row_num, ranges, self.cache_mb, self.index)
 
     def query(self, query):
-        columns, operators, values = query_2_triple(query, with_none=False, split_range=False)
+        if self.cube is not None:
+            cards, dur_ms = self.query_batch([query])
+            return cards[0], dur_ms[0]
+
         start_stmp = time.time()
-        bitmap = np.ones(self.table.row_num, dtype=bool)
-        for c, o, v in zip(columns, operators, values):
-            bitmap &= OPS[o](self.table.data[c], v)
-        card = bitmap.sum()
+        ranges = query_2_ranges(query, self.table)
+        self.prepare(r[0] for r in ranges or [])
+        cards, _ = count_ranges(self.codes, self.hists, self.table.row_num, [ranges], self.cache_mb, self.index)
         dur_ms = (time.time() - start_stmp) * 1e3
-        return card, dur_ms
+        return cards[0], dur_ms
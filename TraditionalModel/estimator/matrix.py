@@ -0,0 +1,68 @@
+import logging
+from typing import Any, Dict
+
+from .estimator import Estimator
+from .utils import run_test
+from ..workload.workload import load_queryset, load_labels
+from ..dataset.dataset import load_table
+
+L = logging.getLogger(__name__)
+
+def build_estimator(seed: int, table, params: Dict[str, Any]) -> Estimator:
+    """estimator of one grid entry, database clients are only imported when used"""
+    name = params['estimator']
+    if name == 'postgres':
+        if params.get('replicas'):
+            from .pool import EstimatorPool
+            from .postgres import Postgres
+            return EstimatorPool(Postgres, params['replicas'], table, stat_target=params['stat_target'], seed=seed)
+        from .postgres import Postgres
+        return Postgres(table, stat_target=params['stat_target'], seed=seed, workers=params.get('workers', 1))
+    elif name == 'mysql':
+        from .mysql import MySQL
+        return MySQL(table, params['bucket'], seed)
+    elif name == 'pgstats':
+        from .pg_stats import PgStats
+        return PgStats(table, stat_target=params['stat_target'], seed=seed)
+    elif name == 'sampling':
+        from .sampling import Sampling
+        return Sampling(table, params['ratio'], seed)
+    raise NotImplementedError(name)
+
+def test_matrix(seed: int, dataset: str, params: Dict[str, Any], overwrite: bool) -> None:
+    """
+    run every (version, workload, estimator) cell of a grid in one process, results are written by run_test per cell
+    params:
+        versions: data versions to test on
+        workloads: workloads to test
+        estimators: list of estimator params, each with its name in 'estimator' and the params of its test command,
+            e.g. {'estimator': 'postgres', 'stat_target': 10}. The estimator is built on 'version' if given and tested
+            on all versions, otherwise it is built on each tested version
+    """
+    versions, workloads = params['versions'], params['workloads']
+    # every table, queryset and label set is loaded once and shared by all cells
+    tables = {}
+    def table_of(version):
+        if version not in tables:
+            tables[version] = load_table(dataset, version)
+        return tables[version]
+    queries = {w: load_queryset(dataset, w)['test'] for w in workloads}
+    labels = {}
+
+    for est_params in params['estimators']:
+        builds = [est_params['version']] if 'version' in est_params else versions
+        for build_version in builds:
+            estimator = build_estimator(seed, table_of(build_version), est_params)
+            L.info(f"built {estimator} on version {build_version}, test it on {len(workloads)} workloads")
+            # replicas and connections are released even if a cell fails
+            try:
+                for version in (versions if 'version' in est_params else [build_version]):
+                    for w in workloads:
+                        if (version, w) not in labels:
+                            labels[(version, w)] = load_labels(dataset, version, w)['test']
+                        L.info(f"cell: version={version}, workload={w}, estimator={estimator}")
+                        run_test(dataset, version, w, estimator, overwrite, query_async=bool(est_params.get('replicas')),
+                                 queries=queries[w], labels=labels[(version, w)], test_row=table_of(version).row_num)
+            finally:
+                if hasattr(estimator, 'close'):
+                    estimator.close()
@@ -31,6 +31,9 @@ class MySQL(Estimator):
 
         L.info(f"construct statistics finished, using {dur_min:.4f} minutes")
 
+    def close(self):
+        self.conn.close()
+
     # def query(self, query):
     #     start_timestamp = time.time()
     #     self.cursor.execute(query)
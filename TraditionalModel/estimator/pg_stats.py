@@ -0,0 +1,213 @@
+import time
+import pickle
+import logging
+from typing import Any, Dict, NamedTuple, List
+import numpy as np
+import pandas as pd
+
+from .estimator import Estimator
+from .utils import run_test, qerror, evaluate_errors
+from ..workload.workload import query_2_sql, as_query_array, load_queryset
+from ..dtypes import is_categorical
+from ..dataset.dataset import load_table
+from ..constants import DATABASE_URL, MODEL_ROOT, PKL_PROTO
+
+L = logging.getLogger(__name__)
+
+# defaults of postgres (utils/selfuncs.h) when there is no statistics
+DEFAULT_EQ_SEL = 0.005
+DEFAULT_INEQ_SEL = 1.0 / 3.0
+DEFAULT_RANGE_INEQ_SEL = 0.005
+DEFAULT_NUM_DISTINCT = 200
+
+class ColumnStats(NamedTuple):
+    null_frac: float
+    n_distinct: float
+    mcv_vals: np.ndarray
+    mcv_freqs: np.ndarray
+    hist: np.ndarray
+
+def snapshot_path(dataset: str, version: str, stat_target: int, seed: int):
+    return MODEL_ROOT / dataset / f"pgstats-{version}-{stat_target}-{seed}.pkl"
+
+def snapshot_pg_stats(table, stat_target, seed) -> Dict[str, Any]:
+    """run ANALYZE through the Postgres estimator once, then keep pg_stats of the table in a local file"""
+    from .postgres import Postgres
+    pg = Postgres(table, stat_target, seed)
+    pg.cursor.execute('SELECT attname, null_frac, n_distinct, most_common_vals::text::text[], most_common_freqs, '
+                      'histogram_bounds::text::text[] FROM pg_stats WHERE tablename=%s', (table.name,))
+    rows = pg.cursor.fetchall()
+    pg.cursor.execute('SELECT reltuples FROM pg_class WHERE relname=%s', (table.name,))
+    reltuples = pg.cursor.fetchone()[0]
+    pg.conn.close()
+
+    # postgres folds unquoted column names to lower case
+    names = {c.lower(): c for c in table.columns.keys()}
+    columns = {}
+    for attname, null_frac, n_distinct, mcv_vals, mcv_freqs, hist in rows:
+        cname = names[attname]
+        parse = str if is_categorical(table.columns[cname].dtype) else float
+        columns[cname] = ColumnStats(
+                null_frac=float(null_frac), n_distinct=float(n_distinct),
+                mcv_vals=np.array([parse(v) for v in mcv_vals or []], dtype=object if parse is str else np.float64),
+                mcv_freqs=np.array(mcv_freqs or [], dtype=np.float64),
+                hist=np.array([parse(v) for v in hist or []], dtype=object if parse is str else np.float64))
+    stats = {'reltuples': float(reltuples), 'columns': columns}
+
+    path = snapshot_path(table.dataset, table.version, stat_target, seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(stats, f, protocol=PKL_PROTO)
+    L.info(f"pg_stats snapshot of {len(columns)} columns dumped to {path}")
+    return stats
+
+def eq_selectivity(stats: ColumnStats, vals: np.ndarray, reltuples: float) -> np.ndarray:
+    """var_eq_const in selfuncs.c"""
+    sumcommon = stats.mcv_freqs.sum()
+    if stats.n_distinct > 0:
+        nd = stats.n_distinct
+    elif stats.n_distinct < 0:
+        nd = -stats.n_distinct * reltuples
+    else:
+        nd = DEFAULT_NUM_DISTINCT
+    nd = max(1.0, np.rint(nd))
+
+    # values not in MCV share the rest of non-null rows evenly
+    other = np.clip(1.0 - sumcommon - stats.null_frac, 0.0, 1.0)
+    otherdistinct = nd - len(stats.mcv_freqs)
+    if otherdistinct > 1:
+        other /= otherdistinct
+    if len(stats.mcv_freqs) > 0 and other > stats.mcv_freqs[-1]:
+        other = stats.mcv_freqs[-1]
+
+    idx = pd.Index(stats.mcv_vals).get_indexer(vals) if len(stats.mcv_vals) > 0 else np.full(len(vals), -1)
+    sel = np.where(idx >= 0, stats.mcv_freqs[np.maximum(idx, 0)] if len(stats.mcv_freqs) > 0 else 0.0, other)
+    return np.where(pd.isnull(vals), 0.0, sel)
+
+def ineq_selectivity(stats: ColumnStats, op: str, vals: np.ndarray) -> np.ndarray:
+    """scalarineqsel in selfuncs.c, op is one of <, <=, >, >="""
+    isgt = op in ('>', '>=')
+    # leftmost histogram entry for which (hist op val) fails if not isgt or succeeds if isgt
+    side = 'left' if op in ('<', '>=') else 'right'
+
+    # MCV part: sum frequencies of MCVs satisfying the predicate
+    order = np.argsort(stats.mcv_vals, kind='stable')
+    mcv_vals = stats.mcv_vals[order]
+    csum = np.concatenate(([0.0], np.cumsum(stats.mcv_freqs[order])))
+    sumcommon = csum[-1]
+    pos = np.searchsorted(mcv_vals, vals, side='right' if op in ('<=', '>') else 'left')
+    mcv_sel = sumcommon - csum[pos] if isgt else csum[pos]
+
+    # histogram part
+    nhist = len(stats.hist)
+    if nhist >= 2:
+        i = np.searchsorted(stats.hist, vals, side=side)
+        lo = stats.hist[np.clip(i-1, 0, nhist-1)]
+        hi = stats.hist[np.clip(i, 0, nhist-1)]
+        if stats.hist.dtype == object:
+            # postgres only interpolates inside a bin for scalar types it can convert
+            binfrac = np.full(len(vals), 0.5)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                binfrac = np.where(hi <= lo, 0.5, np.clip((vals - lo) / (hi - lo), 0.0, 1.0))
+        histfrac = (i - 1 + binfrac) / (nhist - 1)
+        histfrac = np.where(i <= 0, 0.0, np.where(i >= nhist, 1.0, histfrac))
+        hist_sel = 1.0 - histfrac if isgt else histfrac
+        # do not believe extreme estimates from histogram boundaries
+        hist_sel = np.clip(hist_sel, 0.0001, 0.9999)
+    else:
+        hist_sel = 0.5
+
+    sel = (1.0 - stats.null_frac - sumcommon) * hist_sel + mcv_sel
+    return np.where(pd.isnull(vals), 0.0, np.clip(sel, 0.0, 1.0))
+
+def range_selectivity(stats: ColumnStats, lvals: np.ndarray, rvals: np.ndarray) -> np.ndarray:
+    """pair of >= and <= on the same column, combined as in clauselist_selectivity"""
+    sel = ineq_selectivity(stats, '>=', lvals) + ineq_selectivity(stats, '<=', rvals) - 1.0
+    # adjust for double-exclusion of NULLs
+    sel += stats.null_frac
+    return np.where(sel > 0.0, sel, np.where(sel < -0.01, DEFAULT_RANGE_INEQ_SEL, 1.0e-10))
+
+class PgStats(Estimator):
+    """Replay postgres' single table selectivity estimation from a local snapshot of pg_stats
+    Text columns are compared in Python order instead of the database collation.
+    """
+    def __init__(self, table, stat_target, seed):
+        super(PgStats, self).__init__(table=table, version=table.version, stat=stat_target, seed=seed)
+        path = snapshot_path(table.dataset, table.version, stat_target, seed)
+        if path.is_file():
+            L.info(f"load pg_stats snapshot from {path}")
+            with open(path, 'rb') as f:
+                self.stats = pickle.load(f)
+        else:
+            self.stats = snapshot_pg_stats(table, stat_target, seed)
+        self.reltuples = self.stats['reltuples'] if self.stats['reltuples'] > 0 else table.row_num
+
+    def query(self, query):
+        est_cards, dur_ms = self.query_batch([query])
+        return est_cards[0], dur_ms[0]
+
+    def query_batch(self, queries):
+        start_stmp = time.time()
+        sels = np.ones(len(queries), dtype=np.float64)
+        queries = as_query_array(queries, list(self.table.columns.keys()))
+        # predicates are grouped by (column, operator) to estimate them together
+        for j, o, qids in queries.predicate_groups():
+            c = queries.columns[j]
+            stats = self.stats['columns'].get(c)
+            dtype = object if is_categorical(self.table.columns[c].dtype) else np.float64
+            vals = queries.literals(j, o, qids)
+            if o == '[]':
+                if stats is None:
+                    s = DEFAULT_RANGE_INEQ_SEL
+                else:
+                    s = range_selectivity(stats, np.asarray(vals[0], dtype=dtype), np.asarray(vals[1], dtype=dtype))
+            elif o == '=':
+                s = DEFAULT_EQ_SEL if stats is None else eq_selectivity(stats, np.asarray(vals, dtype=dtype), self.reltuples)
+            else:
+                s = DEFAULT_INEQ_SEL if stats is None else ineq_selectivity(stats, o, np.asarray(vals, dtype=dtype))
+            sels[qids] *= s
+
+        # clamp_row_est
+        est_cards = np.maximum(1.0, np.rint(self.reltuples * sels))
+        dur_ms = np.full(len(queries), (time.time() - start_stmp) * 1e3 / max(len(queries), 1))
+        return est_cards, dur_ms
+
+def validate_pg_stats(estimator: PgStats, queries: List, sample_num: int, seed: int) -> Dict[str, float]:
+    """compare replayed estimates with EXPLAIN of a live server holding the same statistics"""
+    import psycopg2
+    rng = np.random.RandomState(seed)
+    ids = np.sort(rng.choice(len(queries), size=min(sample_num, len(queries)), replace=False))
+    sample = [queries[i] for i in ids]
+
+    est_cards, _ = estimator.query_batch(sample)
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    pg_cards = []
+    for q in sample:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query_2_sql(q, estimator.table, aggregate=False)}")
+        pg_cards.append(cursor.fetchall()[0][0][0]['Plan']['Plan Rows'])
+    conn.close()
+
+    errors = np.array([qerror(float(e), float(p)) for e, p in zip(est_cards, pg_cards)])
+    L.info(f"Validate on {len(sample)} queries, {np.mean(errors == 1.0)*100:.2f}% estimates are identical to EXPLAIN")
+    for i in np.argsort(-errors)[:5]:
+        L.info(f"replay={est_cards[i]}, explain={pg_cards[i]}: {query_2_sql(sample[i], estimator.table)}")
+    return evaluate_errors(errors)
+
+def test_pg_stats(seed: int, dataset: str, version: str, workload: str, params: Dict[str, Any], overwrite: bool):
+    """
+    params:
+        version: the version of table that postgres construct statistics, might not be the same with the one we test on
+        stat_target: statistics target of each column
+        validate: number of test queries checked against a live EXPLAIN, skip validation if not given
+    """
+    table = load_table(dataset, params.get('version', version))
+    L.info("construct pg_stats replay estimator...")
+    estimator = PgStats(table, stat_target=params['stat_target'], seed=seed)
+    L.info(f"built pg_stats replay estimator: {estimator}")
+
+    if params.get('validate'):
+        validate_pg_stats(estimator, load_queryset(dataset, workload)['test'], params['validate'], seed)
+
+    run_test(dataset, version, workload, estimator, overwrite)
@@ -0,0 +1,145 @@
+import queue
+import logging
+import multiprocessing as mp
+from typing import Any, List, NamedTuple, Type
+import numpy as np
+
+from .estimator import Estimator
+
+L = logging.getLogger(__name__)
+
+# seconds to wait for a replica before checking whether it is still alive
+RECEIVE_TIMEOUT = 5
+
+class QueryResult(NamedTuple):
+    i: int
+    est_card: float
+    dur_ms: float
+
+def _serve(cls, table, kwargs, inbox, outbox):
+    # every reply is tagged with the id of the request it answers, construction is request 0
+    try:
+        estimator = cls(table, **kwargs)
+    except Exception as e:
+        outbox.put((0, e))
+        return
+    outbox.put((0, repr(estimator)))
+
+    stats = []
+    error = None
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            break
+        if msg[0] == 'stats':
+            # a failing query is reported in place of the stats instead of killing the replica
+            outbox.put((msg[1], stats if error is None else error))
+            stats = []
+            error = None
+        elif msg[0] == 'sql':
+            try:
+                outbox.put((msg[1], estimator.query_sql(msg[2])))
+            except Exception as e:
+                outbox.put((msg[1], e))
+        elif error is None:
+            _, i, query = msg
+            try:
+                est_card, dur_ms = estimator.query(query)
+            except Exception as e:
+                error = e
+                continue
+            stats.append(QueryResult(i=i, est_card=est_card, dur_ms=dur_ms))
+
+class Worker(object):
+    """one replica of an estimator living in its own process"""
+    def __init__(self, cls: Type[Estimator], table, kwargs) -> None:
+        self.inbox = mp.Queue()
+        self.outbox = mp.Queue()
+        self.request_id = 0
+        self.process = mp.Process(target=_serve, args=(cls, table, kwargs, self.inbox, self.outbox), daemon=True)
+        self.process.start()
+
+    def receive(self, request_id: int=0) -> Any:
+        while True:
+            try:
+                reply_id, msg = self.outbox.get(timeout=RECEIVE_TIMEOUT)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"replica {self.process.pid} died with exit code {self.process.exitcode}")
+                continue
+            # replies to requests given up on (e.g. after an error) are dropped
+            if reply_id == request_id:
+                break
+        if isinstance(msg, Exception):
+            raise msg
+        return msg
+
+    def request(self, kind: str, *args: Any) -> Any:
+        self.request_id += 1
+        self.inbox.put((kind, self.request_id) + args)
+        return self.receive(self.request_id)
+
+    def query(self, query: Any, i: int) -> None:
+        self.inbox.put(('query', i, query))
+
+    def query_sql(self, sql: str) -> Any:
+        return self.request('sql', sql)
+
+    def get_stats(self) -> List[QueryResult]:
+        """wait for all dispatched queries, return their results in dispatch order"""
+        return self.request('stats')
+
+    def close(self) -> None:
+        self.inbox.put(None)
+        self.process.join()
+
+    def terminate(self) -> None:
+        self.process.terminate()
+        self.process.join()
+
+class EstimatorPool(object):
+    """Turn an estimator into N replicas in local processes, queries are dispatched round-robin"""
+    def __init__(self, cls: Type[Estimator], num_workers: int, table, **kwargs: Any) -> None:
+        self.table = table
+        self.num_workers = num_workers
+        L.info(f"start {num_workers} replicas of {cls.__name__}...")
+        self.workers = [Worker(cls, table, kwargs) for _ in range(num_workers)]
+        # replicas are built in parallel, wait until all of them are ready
+        try:
+            self.name = [w.receive() for w in self.workers][0]
+        except Exception:
+            # do not leave the other replicas running (or still building) behind
+            for w in self.workers:
+                w.terminate()
+            raise
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def query_async(self, query: Any, i: int) -> None:
+        self.workers[i % self.num_workers].query(query, i)
+
+    def get_stats(self) -> List[List[QueryResult]]:
+        return [w.get_stats() for w in self.workers]
+
+    def query_sql(self, sql: str) -> Any:
+        """run query_sql of the estimator on the first replica"""
+        return self.workers[0].query_sql(sql)
+
+    def query(self, query):
+        est_cards, dur_ms = self.query_batch([query])
+        return est_cards[0], dur_ms[0]
+
+    def query_batch(self, queries):
+        for i, query in enumerate(queries):
+            self.query_async(query, i)
+        est_cards = np.zeros(len(queries), dtype=np.float64)
+        dur_ms = np.zeros(len(queries), dtype=np.float64)
+        for stats in self.get_stats():
+            for r in stats:
+                est_cards[r.i], dur_ms[r.i] = r.est_card, r.dur_ms
+        return est_cards, dur_ms
+
+    def close(self) -> None:
+        for w in self.workers:
+            w.close()
@@ -1,9 +1,13 @@
 import time
 import psycopg2
+import psycopg2.pool
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
+import numpy as np
 
 from .estimator import Estimator
+from .pool import EstimatorPool
 from .utils import run_test
 from ..workload.workload import query_2_sql
 from ..dataset.dataset import load_table
@@ -12,9 +16,11 @@ from ..constants import DATABASE_URL
 logger = logging.getLogger(__name__)
 
 class Postgres(Estimator):
-    def __init__(self, table, stat_target, seed):
+    def __init__(self, table, stat_target, seed, workers=1):
         super().__init__(table=table, version=table.version, stat=stat_target, seed=seed)
-        
+        # number of connections used by query_batch, statistics built below are shared by all of them
+        self.workers = workers
+
         self.conn = psycopg2.connect(DATABASE_URL)
         self.conn.autocommit = True
         self.cursor = self.conn.cursor()
@@ -33,6 +39,9 @@ class Postgres(Estimator):
 
         logger.info(f"Statistics construction completed in {duration_minutes:.4f} minutes, consuming {size_mb:.2f} MBs")
 
+        # connections of query_batch are opened once and reused by every batch
+        self.pool = psycopg2.pool.ThreadedConnectionPool(workers, workers, DATABASE_URL) if workers > 1 else None
+
     def query_sql(self, sql):
         sql_explain = f'EXPLAIN (FORMAT JSON) {sql}'
         start_timestamp = time.time()
@@ -42,6 +51,11 @@ class Postgres(Estimator):
         duration_ms = (time.time() - start_timestamp) * 1000
         return estimated_cardinality, duration_ms
 
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+        self.conn.close()
+
     def query(self, query):
         sql = 'explain(format json) {}'.format(query_2_sql(query, self.table, aggregate=False))
         #  L.info('sql: {}'.format(sql))
@@ -54,6 +68,34 @@ class Postgres(Estimator):
         #  L.info(card)
         return card, dur_ms
 
+    def query_batch(self, queries):
+        if self.workers <= 1:
+            return super().query_batch(queries)
+
+        sqls = ['explain(format json) {}'.format(query_2_sql(q, self.table, aggregate=False)) for q in queries]
+        pool = self.pool
+
+        def explain(sql):
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    # latency of each query is still measured on its own round trip
+                    start_stmp = time.time()
+                    cursor.execute(sql)
+                    dur_ms = (time.time() - start_stmp) * 1e3
+                    res = cursor.fetchall()
+            finally:
+                pool.putconn(conn)
+            return res[0][0][0]['Plan']['Plan Rows'], dur_ms
+
+        logger.info(f"Explain {len(sqls)} queries with {self.workers} connections...")
+        with ThreadPoolExecutor(self.workers) as executor:
+            # map keeps the input order
+            results = list(executor.map(explain, sqls))
+        est_cards = np.array([r[0] for r in results], dtype=np.float64)
+        dur_ms = np.array([r[1] for r in results], dtype=np.float64)
+        return est_cards, dur_ms
+
     def query_sql(self, sql):
         sql_explain = f'EXPLAIN (FORMAT JSON) {sql}'
         start_timestamp = time.time()
@@ -69,7 +111,10 @@ def test_postgres(seed: int, dataset: str, version: str, workload: str, params:
     """
     table = load_table(dataset, params.get('version', version))
     logger.info("Constructing PostgreSQL estimator...")
-    estimator = Postgres(table, stat_target=params['stat_target'], seed=seed)
+    if params.get('replicas'):
+        estimator = EstimatorPool(Postgres, params['replicas'], table, stat_target=params['stat_target'], seed=seed)
+    else:
+        estimator = Postgres(table, stat_target=params['stat_target'], seed=seed, workers=params.get('workers', 1))
     logger.info(f"PostgreSQL estimator constructed: {estimator}")
 
     queries = pd.read_csv('queries.csv')
@@ -79,6 +124,6 @@ def test_postgres(seed: int, dataset: str, version: str, workload: str, params:
         card, duration = estimator.query_sql(sql_query)
         logger.info(f"Query {idx+1}: Estimated cardinality = {card}, Duration = {duration} ms")
 
-    run_test(dataset, version, workload, estimator, overwrite)
+    run_test(dataset, version, workload, estimator, overwrite, query_async=bool(params.get('replicas')))
 
 
@@ -0,0 +1,37 @@
+import time
+import logging
+import numpy as np
+
+from .estimator import Estimator, count_ranges
+from ..workload.workload import queries_2_ranges
+
+L = logging.getLogger(__name__)
+
+class Sampling(Estimator):
+    def __init__(self, table, ratio, seed):
+        super(Sampling, self).__init__(table=table, version=table.version, ratio=ratio, seed=seed)
+
+        # draw a uniform row sample and keep it as compact column codes
+        start_stmp = time.time()
+        rng = np.random.RandomState(seed)
+        self.sample_num = min(table.row_num, max(1, int(round(table.row_num * ratio))))
+        row_ids = np.sort(rng.choice(table.row_num, size=self.sample_num, replace=False))
+        self.codes = {}
+        self.hists = {}
+        for c, col in table.columns.items():
+            # only the sampled pages of each column are read
+            codes = np.asarray(table.codes(c)[row_ids], dtype=np.int64)
+            self.codes[c] = codes.astype(np.min_scalar_type(col.vocab_size), copy=False)
+            self.hists[c] = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=col.vocab_size))))
+        self.scale = table.row_num / self.sample_num
+        dur_min = (time.time() - start_stmp) / 60
+        L.info(f"construct sample with {self.sample_num} rows finished, using {dur_min:.4f} minutes")
+
+    def query(self, query):
+        cards, dur_ms = self.query_batch([query])
+        return cards[0], dur_ms[0]
+
+    def query_batch(self, queries):
+        ranges = queries_2_ranges(queries, self.table)
+        cards, dur_ms = count_ranges(self.codes, self.hists, self.sample_num, ranges)
+        return cards * self.scale, dur_ms
@@ -1,15 +1,13 @@
-import csv
-import ray
 import logging
 import numpy as np
 import pandas as pd
-import torch
 from scipy.stats.mstats import gmean
 
 
 from .estimator import Estimator
+from .cache import EstimateCache
 from ..constants import NUM_THREADS, RESULT_ROOT
-from ..workload.workload import load_queryset, load_labels
+from ..workload.workload import Sharded, load_queryset, load_labels, label_cardinality
 from ..dataset.dataset import load_table
 
 L = logging.getLogger(__name__)
@@ -37,13 +35,22 @@ def qerror(est_card, card):
     else:
         return card / est_card
 
+def qerrors(est_cards, cards):
+    """vectorized qerror over arrays"""
+    est_cards = np.asarray(est_cards, dtype=np.float64)
+    cards = np.asarray(cards, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(est_cards > cards, est_cards / cards, cards / est_cards)
+    return np.select([(est_cards == 0) & (cards == 0), est_cards == 0, cards == 0],
+                     [1.0, cards, est_cards], ratio)
+
 def rmserror(preds, labels, total_rows):
+    preds = np.asarray(preds, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
     return np.sqrt(np.mean(np.square(preds/total_rows-labels/total_rows)))
 
 def evaluate(preds, labels, total_rows=-1):
-    errors = []
-    for i in range(len(preds)):
-        errors.append(qerror(float(preds[i]), float(labels[i])))
+    errors = qerrors(preds, labels)
 
     metrics = {
         'max': np.max(errors),
@@ -58,7 +65,7 @@ def evaluate(preds, labels, total_rows=-1):
     if total_rows > 0:
         metrics['rms'] = rmserror(preds, labels, total_rows)
     L.info(f"{metrics}")
-    return np.array(errors), metrics
+    return errors, metrics
 
 def evaluate_errors(errors):
     metrics = {
@@ -99,19 +106,36 @@ def report_dynamic_errors(dataset, old_new_file, new_new_file, max_t, current_t)
             print('Cannot open file.')
     return -1
 
+def dump_results(result_file, est_cards, cards, dur_ms):
+    """write one row per query in order, return the q-errors"""
+    errors = qerrors(est_cards, cards)
+    pd.DataFrame({
+        'id': np.arange(len(errors)),
+        'error': errors,
+        'predict': est_cards,
+        'label': cards,
+        'dur_ms': dur_ms
+    }).to_csv(result_file, index=False)
+    return errors
+
 def lazy_derive(origin_result_file, result_file, r, labels):
     L.info("Already have the original result, directly derive the new prediction!")
     df = pd.read_csv(origin_result_file)
-    with open(result_file, 'w') as f:
-        writer = csv.writer(f)
-        writer.writerow(['id', 'error', 'predict', 'label', 'dur_ms'])
-        for index, row in df.iterrows():
-            p = np.round(row['predict'] * r)
-            l = labels[index].cardinality
-            writer.writerow([int(row['id']), qerror(p, l), p, l, row['dur_ms']])
+    cards = label_cardinality(labels)
+    dump_results(result_file, np.round(df['predict'].values * r), cards[df['id'].values.astype(int)], df['dur_ms'].values)
     L.info("Done infering all predictions from previous result")
 
-def run_test(dataset: str, version: str, workload: str, estimator: Estimator, overwrite: bool, lazy: bool=True, lw_vec=None, query_async=False) -> None:
+def query_shards(query_batch, queries):
+    """query_batch over a sharded workload one shard at a time, so that only one shard of queries is in memory"""
+    if not isinstance(queries, Sharded):
+        return query_batch(queries)
+    results = [query_batch(shard) for shard in queries.shards()]
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+def run_test(dataset: str, version: str, workload: str, estimator: Estimator, overwrite: bool, lazy: bool=True, lw_vec=None, query_async=False, cache: bool=True,
+             queries=None, labels=None, test_row: int=None) -> None:
+    """queries, labels (test group) and row number of the tested version are loaded here if not given"""
+    import torch
     # for inference speed.
     torch.backends.cudnn.deterministic = False
     torch.backends.cudnn.benchmark = True
@@ -121,16 +145,17 @@ def run_test(dataset: str, version: str, workload: str, estimator: Estimator, ov
     assert NUM_THREADS == torch.get_num_threads(), torch.get_num_threads()
     L.info(f"torch threads: {torch.get_num_threads()}")
 
-    L.info(f"Start loading queryset:{workload} and labels for version {version} of dataset {dataset}...")
-    # only keep test queries
-    queries = load_queryset(dataset, workload)['test']
-    labels = load_labels(dataset, version, workload)['test']
+    if queries is None or labels is None:
+        L.info(f"Start loading queryset:{workload} and labels for version {version} of dataset {dataset}...")
+        # only keep test queries
+        queries = load_queryset(dataset, workload)['test']
+        labels = load_labels(dataset, version, workload)['test']
 
     if lw_vec is not None:
         X, gt = lw_vec
         #  assert isinstance(estimator, LWNN) or isinstance(estimator, LWTree), estimator
         assert len(X) == len(queries), len(X)
-        assert np.array_equal(np.array([l.cardinality for l in labels]), gt)
+        assert np.array_equal(label_cardinality(labels), gt)
         L.info("Hack for LW's method, use processed vector instead of raw query")
         queries = X
 
@@ -139,12 +164,14 @@ def run_test(dataset: str, version: str, workload: str, estimator: Estimator, ov
     result_path.mkdir(parents=True, exist_ok=True)
     result_file = result_path / f"{version}-{workload}-{estimator}.csv"
     if not overwrite and result_file.is_file():
-        L.info(f"Already have the result {result_file}, do not run again!")
-        exit(0)
+        if len(pd.read_csv(result_file)) == len(queries):
+            L.info(f"Already have the result {result_file}, do not run again!")
+            return
+        L.info(f"Result {result_file} does not cover the workload, test again with cached estimates")
 
     r = 1.0
     if version != estimator.table.version:
-        test_row = load_table(dataset, version).row_num
+        test_row = load_table(dataset, version).row_num if test_row is None else test_row
         r = test_row / estimator.table.row_num
         L.info(f"Testing on a different data version, need to adjust the prediction according to the row number ratio {r} = {test_row} / {estimator.table.row_num}!")
 
@@ -158,41 +185,28 @@ def run_test(dataset: str, version: str, workload: str, estimator: Estimator, ov
             estimator.query_async(query, i)
 
         L.info('Waiting for queries to finish...')
-        stats = ray.get([w.get_stats.remote() for w in estimator.workers])
+        stats = estimator.get_stats()
 
-        errors = []
+        est_cards = []
         latencys = []
-        with open(result_file, 'w') as f:
-            writer = csv.writer(f)
-            writer.writerow(['id', 'error', 'predict', 'label', 'dur_ms'])
-            for i, label in enumerate(labels):
-                r = stats[i%estimator.num_workers][i//estimator.num_workers]
-                assert i == r.i, r
-                error = qerror(r.est_card, label.cardinality)
-                errors.append(error)
-                latencys.append(r.dur_ms)
-                writer.writerow([i, error, r.est_card, label.cardinality, r.dur_ms])
+        for i in range(len(labels)):
+            res = stats[i%estimator.num_workers][i//estimator.num_workers]
+            assert i == res.i, res
+            est_cards.append(res.est_card)
+            latencys.append(res.dur_ms)
+        errors = dump_results(result_file, np.round(r * np.array(est_cards)), label_cardinality(labels), np.array(latencys))
 
         L.info(f"Test finished, {np.mean(latencys)} ms/query in average")
         evaluate_errors(errors)
         return
 
     L.info("Start test estimator on test queries...")
-    errors = []
-    latencys = []
-    with open(result_file, 'w') as f:
-        writer = csv.writer(f)
-        writer.writerow(['id', 'error', 'predict', 'label', 'dur_ms'])
-        for i, data in enumerate(zip(queries, labels)):
-            query, label = data
-            est_card, dur_ms = estimator.query(query)
-            est_card = np.round(r * est_card)
-            error = qerror(est_card, label.cardinality)
-            errors.append(error)
-            latencys.append(dur_ms)
-            writer.writerow([i, error, est_card, label.cardinality, dur_ms])
-            if (i+1) % 1000 == 0:
-                L.info(f"{i+1} queries finished")
+    if cache and lw_vec is None:
+        # overwrite re-runs every query, the fresh estimates (and latencies) replace the cached ones
+        est_cards, latencys = EstimateCache(dataset, estimator, refresh=overwrite).query_batch(estimator, queries)
+    else:
+        est_cards, latencys = query_shards(estimator.query_batch, queries)
+    errors = dump_results(result_file, np.round(r * est_cards), label_cardinality(labels), latencys)
     L.info(f"Test finished, {np.mean(latencys)} ms/query in average")
     evaluate_errors(errors)
 
@@ -1,13 +1,12 @@
 import csv
 import logging
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Set
 import numpy as np
 
-from .workload import load_queryset, load_labels, query_2_quicksel_vector, new_query
+from .workload import LabelArray, load_labels, load_features
 from ..dtypes import is_discrete, is_categorical
-from ..dataset.dataset import load_table
-from ..estimator.estimator import Oracle
+from ..dataset.dataset import Column, Table, load_table
 from ..constants import DATA_ROOT
 
 L = logging.getLogger(__name__)
@@ -20,9 +19,19 @@ def dump_quicksel_query_files(dataset: str, version: str, workload: str, overwri
         return
 
     table = load_table(dataset, version)
-    queryset = load_queryset(dataset, workload)
     labels = load_labels(dataset, version, workload)
+    discrete_cols = detect_discrete_columns(dataset, table)
+    features = load_features(table, workload, 'quicksel', discrete_cols=discrete_cols)
 
+    for group in ('train', 'test'):
+        L.info(f"Start dump {workload} for {dataset}-{version}")
+        result_file = result_path / f"{workload}-{version}-{group}.csv"
+        with open(result_file, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerows(np.column_stack([features[group], LabelArray.from_labels(labels[group]).selectivity]).tolist())
+        L.info(f"File dumped to {result_file}")
+
+def detect_discrete_columns(dataset: str, table: Table) -> Set[str]:
     discrete_cols = set()
     for col_name, col in table.columns.items():
         # hard code for power dataset since all these columns are actually integers
@@ -32,17 +41,13 @@ def dump_quicksel_query_files(dataset: str, version: str, workload: str, overwri
         if is_discrete(col.dtype):
             discrete_cols.add(col_name)
     L.info(f"Detect discrete columns: {discrete_cols}")
+    return discrete_cols
 
-    for group in ('train', 'test'):
-        L.info(f"Start dump {workload} for {dataset}-{version}")
-        result_file = result_path / f"{workload}-{version}-{group}.csv"
-        with open(result_file, 'w') as f:
-            writer = csv.writer(f)
-            for query, label in zip(queryset[group], labels[group]):
-                vec = query_2_quicksel_vector(query, table, discrete_cols).tolist()
-                vec.append(label.selectivity)
-                writer.writerow(vec)
-        L.info(f"File dumped to {result_file}")
+def single_column_cards(table: Table, col: Column, op: str, vals: Any) -> np.ndarray:
+    """cardinalities of single column predicates, read from the cumulative histogram of the column's codes"""
+    cum = np.concatenate(([0], np.cumsum(np.bincount(table.codes(col.name), minlength=col.vocab_size))))
+    low, high = col.code_ranges(op, vals)
+    return cum[high] - cum[low]
 
 def generate_quicksel_permanent_assertions(dataset: str, version: str, params: Dict[str, Dict[str, Any]], overwrite: bool) -> None:
     result_path = DATA_ROOT / dataset / "quicksel"
@@ -55,96 +60,50 @@ def generate_quicksel_permanent_assertions(dataset: str, version: str, params: D
     count = params['count']+1
 
     table = load_table(dataset, version)
-    oracle = Oracle(table)
-
-    discrete_cols = set()
-    for col_name, col in table.columns.items():
-        # hard code for power dataset since all these columns are actually integers
-        if dataset[:5] == 'power' and col_name in ['Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']:
-            discrete_cols.add(col_name)
-            continue
-        if is_discrete(col.dtype):
-            discrete_cols.add(col_name)
-    L.info(f"Detect discrete columns: {discrete_cols}")
+    discrete_cols = detect_discrete_columns(dataset, table)
 
     with open(result_file, 'w') as f:
         writer = csv.writer(f)
         writer.writerow([0.0, 1.0] * table.col_num + [1.0])
         for col_id, col in enumerate(table.columns.values()):
             L.info(f"Start generate permanent queries on column {col.name}")
-            # hard code for power dataset since all these columns are actually integers
-            if is_discrete(col.dtype) or (dataset[:5] == 'power' and col.name in ['Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']):
+            norm_range = np.linspace(0.0, 1.0, count, dtype=np.float32)
+            if col.name in discrete_cols:
                 if is_categorical(col.dtype):
                     L.info("Categorical column")
                     if col.vocab_size <= count:
-                        for i in range(col.vocab_size):
-                            query = new_query(table, ncols=1)
-                            query.predicates[col.name] = ('=', col.vocab[i])
-                            card, _ = oracle.query(query)
-                            #  vec = query_2_quicksel_vector(query, table, discrete_cols).tolist()
-                            #  vec.append(card/table.row_num)
-                            vec = [0.0, 1.0] * table.col_num
-                            vec.append(card/table.row_num)
-                            vec[col_id*2] = i/col.vocab_size
-                            vec[col_id*2+1] = (i+1)/col.vocab_size
-                            writer.writerow(vec)
-                            L.info(f"# {i}: {query.predicates[col.name]}, card={card}\n\t{vec}")
+                        # one assertion per value
+                        ids = np.arange(col.vocab_size)
+                        cards = single_column_cards(table, col, '=', col.vocab)
+                        lows, highs = ids / col.vocab_size, (ids + 1) / col.vocab_size
                     else:
-                        minval = 0
-                        maxval = col.vocab_size
-                        norm_range = np.linspace(0.0, 1.0, count, dtype=np.float32)
-                        prange = minval + (maxval - minval) * norm_range
-                        for i in range(len(prange)-1):
-                            val0 = col.vocab[np.ceil(prange[i]).astype(int)]
-                            val1 = col.vocab[np.ceil(prange[i+1]).astype(int)-1]
-                            assert np.greater_equal(np.array(val1).astype(object), val0), (val1, val0)
-                            query = new_query(table, ncols=1)
-                            query.predicates[col.name] = ('[]', (val0, val1))
-                            card, _ = oracle.query(query)
-                            #  vec = query_2_quicksel_vector(query, table, discrete_cols).tolist()
-                            #  vec.append(card/table.row_num)
-
-                            vec = [0.0, 1.0] * table.col_num
-                            vec.append(card/table.row_num)
-                            vec[col_id*2] = norm_range[i]
-                            vec[col_id*2+1] = norm_range[i+1]
-                            writer.writerow(vec)
-                            L.info(f"# {i}: {query.predicates[col.name]}, card={card}\n\t{vec}")
+                        prange = col.vocab_size * norm_range
+                        val0 = col.vocab[np.ceil(prange[:-1]).astype(int)]
+                        val1 = col.vocab[np.ceil(prange[1:]).astype(int)-1]
+                        assert np.all(np.greater_equal(val1.astype(object), val0)), (val1, val0)
+                        cards = single_column_cards(table, col, '[]', (val0, val1))
+                        lows, highs = norm_range[:-1], norm_range[1:]
                 else:
                     L.info("Integer column")
                     minval = col.minval
                     maxval = col.maxval + 1
-                    norm_range = np.linspace(0.0, 1.0, count, dtype=np.float32)
                     prange = minval + (maxval - minval) * norm_range
-                    for i in range(len(prange)-1):
-                        val0 = np.ceil(prange[i])
-                        val1 = np.ceil(prange[i+1])-1
-                        assert val1 >= val0, (val0, val1)
-                        query = new_query(table, ncols=1)
-                        query.predicates[col.name] = ('[]', (val0, val1))
-                        card, _ = oracle.query(query)
-                        #  vec = query_2_quicksel_vector(query, table, discrete_cols).tolist()
-                        #  vec.append(card/table.row_num)
-
-                        vec = [0.0, 1.0] * table.col_num
-                        vec.append(card/table.row_num)
-                        vec[col_id*2] = norm_range[i]
-                        vec[col_id*2+1] = norm_range[i+1]
-                        writer.writerow(vec)
-                        L.info(f"# {i}: {query.predicates[col.name]}, card={card}\n\t{vec}")
+                    val0 = np.ceil(prange[:-1])
+                    val1 = np.ceil(prange[1:])-1
+                    assert np.all(val1 >= val0), (val0, val1)
+                    cards = single_column_cards(table, col, '[]', (val0, val1))
+                    lows, highs = norm_range[:-1], norm_range[1:]
             else:
                 L.info("Real-value column")
-                norm_range = np.linspace(0.0, 1.0, count, dtype=np.float32)
                 prange = col.minval + (col.maxval - col.minval) * norm_range
-                for i in range(len(prange)-1):
-                    query = new_query(table, ncols=1)
-                    query.predicates[col.name] = ('[]', (prange[i], prange[i+1]))
-                    card, _ = oracle.query(query)
-                    #  vec = query_2_quicksel_vector(query, table, discrete_cols).tolist()
-                    #  vec.append(card/table.row_num)
-                    vec = [0.0, 1.0] * table.col_num
-                    vec.append(card/table.row_num)
-                    vec[col_id*2] = norm_range[i]
-                    vec[col_id*2+1] = norm_range[i+1]
-                    writer.writerow(vec)
-                    L.info(f"# {i}: {query.predicates[col.name]}, card={card}\n\t{vec}")
+                cards = single_column_cards(table, col, '[]', (prange[:-1], prange[1:]))
+                lows, highs = norm_range[:-1], norm_range[1:]
+
+            sels = cards / table.row_num
+            for low, high, sel in zip(lows, highs, sels):
+                vec = [0.0, 1.0] * table.col_num
+                vec.append(sel)
+                vec[col_id*2] = low
+                vec[col_id*2+1] = high
+                writer.writerow(vec)
+            L.info(f"{len(sels)} assertions on column {col.name}, selectivity sum={sels.sum()}")
@@ -1,27 +1,77 @@
 import logging
-from typing import List, Dict
+import numpy as np
+from typing import List, Dict, Optional
 
-from .workload import Label, Query, load_queryset, dump_labels
+from .workload import (LabelArray, Query, QueryArray, Sharded, as_query_array, load_queryset, dump_labels, load_labels,
+                       label_cardinality, save_labels, shard_file)
 from ..estimator.estimator import Oracle
+from ..estimator.sampling import Sampling
 from ..dataset.dataset import Table, load_table
 
 L = logging.getLogger(__name__)
 
-def generate_labels_for_queries(table: Table, queryset: Dict[str, List[Query]]) -> Dict[str, List[Label]]:
-    oracle = Oracle(table)
+def split_labels(table: Table, queryset: Dict[str, List[Query]], cards: np.ndarray) -> Dict[str, LabelArray]:
+    """split cardinalities of all queries in queryset order into labels of each group"""
     labels = {}
+    start = 0
     for group, queries in queryset.items():
-        l = []
-        for i, q in enumerate(queries):
-            card, _ = oracle.query(q)
-            l.append(Label(cardinality=card, selectivity=card/table.row_num))
-            if (i+1) % 1000 == 0:
-                L.info(f"{i+1} labels generated for {group}")
-        labels[group] = l
-
+        group_cards = cards[start:start+len(queries)].astype(np.int64)
+        labels[group] = LabelArray(group_cards, group_cards / table.row_num)
+        start += len(queries)
+        L.info(f"{len(queries)} labels generated for {group}")
     return labels
 
-def generate_labels(dataset: str, version: str, workload: str) -> None:
+def all_queries(table: Table, queryset: Dict[str, List[Query]]) -> QueryArray:
+    columns = list(table.columns.keys())
+    return QueryArray.concat([as_query_array(queries, columns) for queries in queryset.values()])
+
+def generate_labels_for_queries(table: Table, queryset: Dict[str, List[Query]], workers: int=1) -> Dict[str, LabelArray]:
+    oracle = Oracle(table, workers=workers)
+    # label all groups in one batch so that masks (and worker processes) are shared
+    cards, _ = oracle.query_batch(all_queries(table, queryset))
+    return split_labels(table, queryset, cards)
+
+def delta_oracles(table: Table, workers: int=1) -> List[Oracle]:
+    """oracles over the segments appended to the base version of table"""
+    assert table.base is not None, f"{table.name} is not appended to another version"
+    base_segments = load_table(table.dataset, table.base).segments or [table.base]
+    return [Oracle(seg, workers=workers) for seg in table.segment_tables()[len(base_segments):]]
+
+def delta_cards(oracles: List[Oracle], queries: QueryArray, base_cards: np.ndarray) -> np.ndarray:
+    cards = np.array(base_cards, dtype=np.int64)
+    for oracle in oracles:
+        L.info(f"count {len(queries)} queries on appended segment {oracle.table.version} ({oracle.table.row_num} rows)")
+        seg_cards, _ = oracle.query_batch(queries)
+        cards += seg_cards.astype(np.int64)
+    return cards
+
+def check_base_labels(queryset: Dict[str, List[Query]], base_labels: Dict[str, LabelArray]) -> None:
+    for group, queries in queryset.items():
+        # labels of an older generation of the workload do not line up with the queries
+        assert len(base_labels[group]) == len(queries), (group, len(base_labels[group]), len(queries))
+
+def generate_delta_labels_for_queries(table: Table, queryset: Dict[str, List[Query]], base_labels: Dict[str, LabelArray],
+                                      workers: int=1) -> Dict[str, LabelArray]:
+    """labels of a table appended to its base: base labels plus counts over the appended segments only"""
+    oracles = delta_oracles(table, workers)
+    check_base_labels(queryset, base_labels)
+    cards = np.concatenate([label_cardinality(base_labels[group]) for group in queryset.keys()])
+    return split_labels(table, queryset, delta_cards(oracles, all_queries(table, queryset), cards))
+
+def load_base_labels(table: Table, workload: str) -> Optional[Dict[str, LabelArray]]:
+    """labels of the version table is appended to, None if there are none"""
+    if table.base is None:
+        return None
+    try:
+        base_labels = load_labels(table.dataset, table.base, workload)
+    except FileNotFoundError:
+        return None
+    # label shards are only read on use
+    if any(isinstance(ls, Sharded) and not all(f.is_file() for f in ls.files) for ls in base_labels.values()):
+        return None
+    return base_labels
+
+def generate_labels(dataset: str, version: str, workload: str, workers: int=1, delta: bool=False) -> None:
 
     L.info("Load table...")
     table = load_table(dataset, version)
@@ -29,24 +79,43 @@ def generate_labels(dataset: str, version: str, workload: str) -> None:
     L.info("Load queryset from disk...")
     queryset = load_queryset(dataset, workload)
 
-    L.info("Start generate ground truth labels for the workload...")
-    labels = generate_labels_for_queries(table, queryset)
+    base_labels = None
+    if delta:
+        base_labels = load_base_labels(table, workload)
+        if base_labels is None:
+            L.warning(f"No labels of the base version of {version} to start from, label the whole table")
+
+    if any(isinstance(queries, Sharded) for queries in queryset.values()):
+        if base_labels is not None:
+            L.info(f"Start generate ground truth labels for the workload shard by shard from labels of {table.base}...")
+            oracles = delta_oracles(table, workers)
+            check_base_labels(queryset, base_labels)
+        else:
+            L.info("Start generate ground truth labels for the workload shard by shard...")
+            oracles = [Oracle(table, workers=workers)]
+        for group, queries in queryset.items():
+            for i, shard in enumerate(queries.shards()):
+                base_cards = np.zeros(len(shard), dtype=np.int64) if base_labels is None else base_labels[group].shard(i).cardinality
+                cards = delta_cards(oracles, shard, base_cards)
+                save_labels(shard_file(dataset, workload, group, i, version),
+                            {group: LabelArray(cards, cards / table.row_num)})
+            L.info(f"{len(queries)} labels generated for {group}")
+        return
+
+    if base_labels is not None:
+        L.info(f"Start generate ground truth labels for the workload from labels of {table.base}...")
+        labels = generate_delta_labels_for_queries(table, queryset, base_labels, workers)
+    else:
+        L.info("Start generate ground truth labels for the workload...")
+        labels = generate_labels_for_queries(table, queryset, workers)
 
     L.info("Dump labels to disk...")
     dump_labels(dataset, version, workload, labels)
 
-def update_labels_for_queries(table: Table, queryset: Dict[str, List[Query]], seed: int, sampling_ratio: float=0.05) -> Dict[str, List[Label]]:
+def update_labels_for_queries(table: Table, queryset: Dict[str, List[Query]], seed: int, sampling_ratio: float=0.05) -> Dict[str, LabelArray]:
     sample_ester = Sampling(table, sampling_ratio, seed)
-    labels = {}
-    for group, queries in queryset.items():
-        l = []
-        for i, q in enumerate(queries):
-            card, _ = sample_ester.query(q)
-            l.append(Label(cardinality=card, selectivity=card/table.row_num))
-            if (i+1) % 1000 == 0:
-                L.info(f"{i+1} labels generated for {group}")
-        labels[group] = l
-    return labels
+    cards, _ = sample_ester.query_batch(all_queries(table, queryset))
+    return split_labels(table, queryset, np.round(cards))
 
 def update_labels(seed: int, dataset: str, version: str, workload: str, sampling_ratio: float=0.05) -> None:
 
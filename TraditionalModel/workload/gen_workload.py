@@ -2,27 +2,27 @@ import random
 import logging
 import numpy as np
 from typing import Dict, Any
-import copy
+from multiprocessing import Pool
 
 from . import generator
 from .generator import QueryGenerator
 from .gen_label import generate_labels_for_queries
-from .workload import dump_queryset, dump_labels
-from ..dataset.dataset import load_table
+from .workload import (LabelArray, as_query_array, dump_queryset, dump_labels, dump_manifest,
+                       remove_manifest, save_queryset, save_labels, shard_dir, shard_file)
+from ..estimator.estimator import Oracle
+from ..dataset.dataset import Table, load_table, window_table
 
 L = logging.getLogger(__name__)
 
 def get_focused_table(table, ref_table, win_ratio):
-    focused_table = copy.deepcopy(table)
-    win_size = int(win_ratio * len(ref_table.data))
-    focused_table.data = focused_table.data.tail(win_size).reset_index(drop=True)
-    focused_table.parse_columns()
-    return focused_table
+    """view over the last win_ratio * len(ref_table) rows of table"""
+    win_size = int(win_ratio * ref_table.row_num)
+    return window_table(table, max(table.row_num - win_size, 0))
 
 def generate_workload(
     seed: int, dataset: str, version: str,
     name: str, no_label: bool, old_version: str, win_ratio: str,
-    params: Dict[str, Dict[str, Any]]
+    params: Dict[str, Dict[str, Any]], workers: int=1
 ) -> None:
 
     random.seed(seed)
@@ -58,15 +58,15 @@ def generate_workload(
             center_params=params.get('center_params') or {},
             width_params=params.get('width_params') or {})
 
+    if params.get('shard_size'):
+        generate_workload_shards(seed, dataset, version, name, no_label, table, qgen, params, workers)
+        return
+
     queryset = {}
     for group, num in params['number'].items():
         L.info(f"Start generate workload with {num} queries for {group}...")
-        queries = []
-        for i in range(num):
-            queries.append(qgen.generate())
-            if (i+1) % 1000 == 0:
-                L.info(f"{i+1} queries generated")
-        queryset[group] = queries
+        queryset[group] = qgen.generate_batch(num)
+        L.info(f"{num} queries generated")
 
     L.info("Dump queryset to disk...")
     dump_queryset(dataset, name, queryset)
@@ -76,7 +76,61 @@ def generate_workload(
         return
 
     L.info("Start generate ground truth labels for the workload...")
-    labels = generate_labels_for_queries(table, queryset)
+    labels = generate_labels_for_queries(table, queryset, workers)
 
     L.info("Dump labels to disk...")
     dump_labels(dataset, version, name, labels)
+
+# generator and table shared by the shard worker processes
+SHARD_STATE = {}
+
+def _init_shard_worker(dataset, name, qgen, table, label_version):
+    SHARD_STATE['dataset'] = dataset
+    SHARD_STATE['name'] = name
+    SHARD_STATE['qgen'] = qgen
+    SHARD_STATE['oracle'] = Oracle(table) if label_version is not None else None
+    SHARD_STATE['label_version'] = label_version
+
+def _generate_shard(task):
+    group, shard_id, num, shard_seed = task
+    # a shard only depends on its own seed, no matter which worker generates it after which shard
+    random.seed(shard_seed)
+    np.random.seed(shard_seed)
+    generator.reset_caches()
+    qgen = SHARD_STATE['qgen']
+    queries = as_query_array(qgen.generate_batch(num), list(qgen.table.columns.keys()))
+    dataset, name = SHARD_STATE['dataset'], SHARD_STATE['name']
+    save_queryset(shard_file(dataset, name, group, shard_id), {group: queries})
+    if SHARD_STATE['oracle'] is not None:
+        cards, _ = SHARD_STATE['oracle'].query_batch(queries)
+        labels = LabelArray(cards.astype(np.int64), cards / SHARD_STATE['oracle'].table.row_num)
+        save_labels(shard_file(dataset, name, group, shard_id, SHARD_STATE['label_version']), {group: labels})
+    return group, shard_id
+
+def shard_seed(seed: int, group_id: int, shard_id: int) -> int:
+    return int(np.random.SeedSequence([seed, group_id, shard_id]).generate_state(1)[0])
+
+def generate_workload_shards(
+    seed: int, dataset: str, version: str, name: str, no_label: bool,
+    table: Table, qgen: QueryGenerator, params: Dict[str, Any], workers: int
+) -> None:
+    """generate (and label) shards of params['shard_size'] queries in a pool of processes, each shard is dumped when finished"""
+    shard_size = params['shard_size']
+    manifest = {'seed': seed, 'version': version, 'shard_size': shard_size, 'groups': {}}
+    tasks = []
+    for group_id, (group, num) in enumerate(params['number'].items()):
+        nums = [min(shard_size, num - start) for start in range(0, num, shard_size)]
+        manifest['groups'][group] = [{'num': n, 'seed': shard_seed(seed, group_id, i)} for i, n in enumerate(nums)]
+        tasks.extend((group, i, n, shard['seed']) for i, (n, shard) in enumerate(zip(nums, manifest['groups'][group])))
+
+    shard_dir(dataset, name).mkdir(parents=True, exist_ok=True)
+    remove_manifest(dataset, name)
+    L.info(f"Start generate {len(tasks)} shards of workload {name} with {workers} workers...")
+    label_version = None if no_label else version
+    with Pool(workers, initializer=_init_shard_worker, initargs=(dataset, name, qgen, table, label_version)) as pool:
+        for i, (group, shard_id) in enumerate(pool.imap_unordered(_generate_shard, tasks)):
+            L.info(f"Shard {shard_id} of {group} dumped ({i+1}/{len(tasks)})")
+
+    # the workload only becomes visible to loaders when all shards are there
+    dump_manifest(dataset, name, manifest)
+    L.info(f"Manifest of {name} dumped to {shard_dir(dataset, name)}")
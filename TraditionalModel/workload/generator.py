@@ -21,13 +21,31 @@ def asf_pred_number(table: Table, params: Dict[str, Any]) -> List[str]:
         attr_domain = params['whitelist']
     else:
         blacklist = params.get('blacklist') or []
-        attr_domain = [c for c in list(table.data.columns) if c not in blacklist]
+        attr_domain = [c for c in list(table.columns.keys()) if c not in blacklist]
     nums = params.get('nums')
     nums = nums or range(1, len(attr_domain)+1)
     num_pred = np.random.choice(nums)
     assert num_pred <= len(attr_domain)
     return np.random.choice(attr_domain, size=num_pred, replace=False)
 
+def asf_pred_number_batch(table: Table, n: int, params: Dict[str, Any]) -> np.ndarray:
+    """vectorized asf_pred_number, return (n, col_num) boolean mask of chosen attributes"""
+    columns = list(table.columns.keys())
+    if 'whitelist' in params:
+        attr_domain = params['whitelist']
+    else:
+        blacklist = params.get('blacklist') or []
+        attr_domain = [c for c in columns if c not in blacklist]
+    nums = params.get('nums')
+    nums = nums or range(1, len(attr_domain)+1)
+    num_pred = np.random.choice(nums, size=n)
+    assert num_pred.max(initial=0) <= len(attr_domain)
+    # a random permutation of the domain per query, keep the first num_pred of them
+    ranks = np.argsort(np.argsort(np.random.random((n, len(attr_domain))), axis=1), axis=1)
+    mask = np.zeros((n, len(columns)), dtype=bool)
+    mask[:, [columns.index(c) for c in attr_domain]] = ranks < num_pred[:, None]
+    return mask
+
 def asf_comb(table: Table, params: Dict[str, Any]) -> List[str]:
     assert 'comb' in params and type(params['comb']) == list, params
     for c in params['comb']:
@@ -36,7 +54,7 @@ def asf_comb(table: Table, params: Dict[str, Any]) -> List[str]:
 
 def asf_naru(table: Table, params: Dict[str, Any]) -> List[str]:
     num_filters = np.random.randint(5, 12)
-    return np.random.choice(table.data.columns, size=num_filters, replace=False)
+    return np.random.choice(list(table.columns.keys()), size=num_filters, replace=False)
 
 class CenterSelFunc(Protocol):
     def __call__(self, table: Table, attrs: List[str], params: Dict[str, Any]) -> List[Any]: ...
@@ -61,16 +79,23 @@ def csf_distribution(table: Table, attrs: List[str], params: Dict[str, Any]) ->
     global ROW_CACHE
     if GLOBAL_COUNTER >= 1000:
         data_from = params.get('data_from') or 0
-        ROW_CACHE = np.random.choice(range(data_from, len(table.data)), size=1000)
+        ROW_CACHE = np.random.choice(range(data_from, table.row_num), size=1000)
         GLOBAL_COUNTER = 0
     row_id = ROW_CACHE[GLOBAL_COUNTER]
     GLOBAL_COUNTER += 1
     #  data_from = params.get('data_from') or 0
-    #  row_id = np.random.choice(range(data_from, len(table.data)))
+    #  row_id = np.random.choice(range(data_from, table.row_num))
     return [table.data.at[row_id, a] for a in attrs]
 
+def reset_caches() -> None:
+    """forget the caches of csf_domain and csf_distribution, so that queries only depend on the random seed"""
+    global DOMAIN_CACHE, ROW_CACHE, GLOBAL_COUNTER
+    DOMAIN_CACHE = {}
+    ROW_CACHE = None
+    GLOBAL_COUNTER = 1000
+
 def csf_ood(table: Table, attrs: List[str], params: Dict[str, Any]) -> List[Any]:
-    row_ids = np.random.choice(len(table.data), len(attrs))
+    row_ids = np.random.choice(table.row_num, len(attrs))
     return [table.data.at[i, a] for i, a in zip(row_ids, attrs)]
 
 def csf_vocab_ood(table: Table, attrs: List[str], params: Dict[str, Any]) -> List[Any]:
@@ -91,14 +116,46 @@ def csf_domain_ood(table: Table, attrs: List[str], params: Dict[str, Any]) -> Li
     return centers
 
 def csf_naru(table: Table, attrs: List[str], params: Dict[str, Any]) -> List[Any]:
-    row_id = np.random.randint(0, len(table.data))
+    row_id = np.random.randint(0, table.row_num)
     return [table.data.at[row_id, a] for a in attrs]
 
 def csf_naru_ood(table: Table, attrs: List[str], params: Dict[str, Any]) -> List[Any]:
-    row_ids = np.random.choice(len(table.data), len(attrs))
+    row_ids = np.random.choice(table.row_num, len(attrs))
     return [table.data.at[i, a] for i, a in zip(row_ids, attrs)]
 
 
+def row_values(table: Table, cname: str, row_ids: np.ndarray) -> np.ndarray:
+    """values of a column on given rows, only pages in the rows needed"""
+    return table.columns[cname].vocab[table.codes(cname)[row_ids]]
+
+def csf_distribution_batch(table: Table, mask: np.ndarray, params: Dict[str, Any]) -> List[np.ndarray]:
+    """vectorized csf_distribution, return center values per column (only meaningful where mask is True)"""
+    data_from = params.get('data_from') or 0
+    row_ids = np.random.randint(data_from, table.row_num, size=len(mask))
+    return [row_values(table, c, row_ids) for c in table.columns.keys()]
+
+def csf_naru_batch(table: Table, mask: np.ndarray, params: Dict[str, Any]) -> List[np.ndarray]:
+    row_ids = np.random.randint(0, table.row_num, size=len(mask))
+    return [row_values(table, c, row_ids) for c in table.columns.keys()]
+
+def csf_ood_batch(table: Table, mask: np.ndarray, params: Dict[str, Any]) -> List[np.ndarray]:
+    # each attribute takes its value from an independent row
+    return [row_values(table, c, np.random.randint(0, table.row_num, size=len(mask))) for c in table.columns.keys()]
+
+csf_naru_ood_batch = csf_ood_batch
+
+def csf_vocab_ood_batch(table: Table, mask: np.ndarray, params: Dict[str, Any]) -> List[np.ndarray]:
+    return [col.vocab[np.random.randint(0, col.vocab_size, size=len(mask))] for col in table.columns.values()]
+
+def csf_domain_ood_batch(table: Table, mask: np.ndarray, params: Dict[str, Any]) -> List[np.ndarray]:
+    centers = []
+    for col in table.columns.values():
+        if is_categorical(col.dtype): # randomly pick one point from domain for categorical
+            centers.append(col.vocab[np.random.randint(0, col.vocab_size, size=len(mask))])
+        else: # uniformly pick one point from domain for numerical
+            centers.append(np.random.uniform(col.minval, col.maxval, size=len(mask)))
+    return centers
+
 class WidthSelFunc(Protocol):
     def __call__(self, table: Table, attrs: List[str], centers: List[Any], params: Dict[str, Any]) -> Query: ...
 
@@ -154,6 +211,70 @@ def wsf_equal(table: Table, attrs: List[str], centers: List[Any], params: Dict[s
         query.predicates[a] = ('=', c)
     return query
 
+def parse_range_batch(col: Column, left: np.ndarray, right: np.ndarray) -> List[Tuple[str, Any]]:
+    """vectorized parse_range"""
+    ops = np.where(left <= col.minval, '<=', np.where(right >= col.maxval, '>=', '[]'))
+    return [('<=', r) if o == '<=' else ('>=', l) if o == '>=' else ('[]', (l, r))
+            for o, l, r in zip(ops, left, right)]
+
+def _batch_ranges(table: Table, mask: np.ndarray, centers: List[np.ndarray], widths_of: Any) -> List[List[Any]]:
+    preds = []
+    for j, col in enumerate(table.columns.values()):
+        ids = np.nonzero(mask[:, j])[0]
+        p = [None] * len(mask)
+        c = centers[j][ids]
+        if is_categorical(col.dtype):
+            eq = np.ones(len(ids), dtype=bool)
+        else:
+            # NaN/NaT literal can only be assigned to = operator
+            eq = pd.isnull(c)
+        for i, v in zip(ids[eq], c[eq]):
+            p[i] = ('=', v)
+        rng_ids = ids[~eq]
+        if len(rng_ids) > 0:
+            cr = c[~eq].astype(np.float64)
+            width = widths_of(col, len(rng_ids))
+            for i, r in zip(rng_ids, parse_range_batch(col, cr-width/2, cr+width/2)):
+                p[i] = r
+        preds.append(p)
+    return preds
+
+def wsf_uniform_batch(table: Table, mask: np.ndarray, centers: List[np.ndarray], params: Dict[str, Any]) -> List[List[Any]]:
+    """vectorized wsf_uniform, return predicates per column"""
+    return _batch_ranges(table, mask, centers,
+                         lambda col, n: np.random.uniform(0, col.maxval-col.minval, size=n))
+
+def wsf_exponential_batch(table: Table, mask: np.ndarray, centers: List[np.ndarray], params: Dict[str, Any]) -> List[List[Any]]:
+    return _batch_ranges(table, mask, centers,
+                         lambda col, n: np.random.exponential((col.maxval - col.minval) / 10, size=n))
+
+def wsf_naru_batch(table: Table, mask: np.ndarray, centers: List[np.ndarray], params: Dict[str, Any]) -> List[List[Any]]:
+    preds = []
+    for j, col in enumerate(table.columns.values()):
+        ops = np.random.choice(['>=', '<=', '='], size=len(mask))
+        if col.vocab_size < 10:
+            ops[:] = '='
+        preds.append([(o, v) if m else None for o, v, m in zip(ops, centers[j], mask[:, j])])
+    return preds
+
+def wsf_equal_batch(table: Table, mask: np.ndarray, centers: List[np.ndarray], params: Dict[str, Any]) -> List[List[Any]]:
+    return [[('=', v) if m else None for v, m in zip(centers[j], mask[:, j])] for j in range(len(centers))]
+
+# vectorized counterparts used by QueryGenerator.generate_batch, others fall back to generate
+BATCH_FUNCS = {
+    asf_pred_number: asf_pred_number_batch,
+    csf_distribution: csf_distribution_batch,
+    csf_naru: csf_naru_batch,
+    csf_ood: csf_ood_batch,
+    csf_naru_ood: csf_naru_ood_batch,
+    csf_vocab_ood: csf_vocab_ood_batch,
+    csf_domain_ood: csf_domain_ood_batch,
+    wsf_uniform: wsf_uniform_batch,
+    wsf_exponential: wsf_exponential_batch,
+    wsf_naru: wsf_naru_batch,
+    wsf_equal: wsf_equal_batch,
+}
+
 class QueryGenerator(object):
     table: Table
     attr: Dict[AttributeSelFunc, float]
@@ -192,3 +313,35 @@ class QueryGenerator(object):
         width_func = np.random.choice(list(self.width.keys()), p=list(self.width.values()))
         #  L.info(f'start generate widths {width_func.__name__}')
         return width_func(self.table, attr_lst, center_lst, self.width_params)
+
+    def generate_batch(self, n: int) -> List[Query]:
+        """generate n queries in bulk, following the same distributions as generate"""
+        attr_funcs = list(self.attr.keys())
+        center_funcs = list(self.center.keys())
+        width_funcs = list(self.width.keys())
+        attr_ids = np.random.choice(len(attr_funcs), size=n, p=list(self.attr.values()))
+        center_ids = np.random.choice(len(center_funcs), size=n, p=list(self.center.values()))
+        width_ids = np.random.choice(len(width_funcs), size=n, p=list(self.width.values()))
+
+        queries = [None] * n
+        combos = attr_ids * len(center_funcs) * len(width_funcs) + center_ids * len(width_funcs) + width_ids
+        for combo in np.unique(combos):
+            ids = np.nonzero(combos == combo)[0]
+            funcs = (attr_funcs[attr_ids[ids[0]]], center_funcs[center_ids[ids[0]]], width_funcs[width_ids[ids[0]]])
+            if not all(f in BATCH_FUNCS for f in funcs):
+                for i in ids:
+                    attr_lst = funcs[0](self.table, self.attr_params)
+                    center_lst = funcs[1](self.table, attr_lst, self.center_params)
+                    queries[i] = funcs[2](self.table, attr_lst, center_lst, self.width_params)
+                continue
+
+            mask = BATCH_FUNCS[funcs[0]](self.table, len(ids), self.attr_params)
+            centers = BATCH_FUNCS[funcs[1]](self.table, mask, self.center_params)
+            preds = BATCH_FUNCS[funcs[2]](self.table, mask, centers, self.width_params)
+            columns = list(self.table.columns.keys())
+            for k, i in enumerate(ids):
+                query = new_query(self.table, ncols=int(mask[k].sum()))
+                for j in np.nonzero(mask[k])[0]:
+                    query.predicates[columns[j]] = preds[j][k]
+                queries[i] = query
+        return queries
@@ -1,19 +1,17 @@
 import logging
-from .workload import load_queryset, load_labels, dump_queryset, dump_labels
+from .workload import QueryArray, LabelArray, load_queryset, load_labels, dump_queryset, dump_labels
 
 L = logging.getLogger(__name__)
 
 def merge_workload(dataset: str, version: str, workload: str, count: int=10) -> None:
-    queryset = {'train': [], 'valid': [], 'test': []}
-    labels = {'train': [], 'valid': [], 'test': []}
-
+    qss = []
+    lss = []
     for i in range(count):
         L.info(f"Merge querset {workload}_{i}...")
-        qs = load_queryset(dataset, f"{workload}_{i}")
-        ls = load_labels(dataset, version, f"{workload}_{i}")
-        for k in queryset.keys():
-            queryset[k] += qs[k]
-            labels[k] += ls[k]
+        qss.append(load_queryset(dataset, f"{workload}_{i}"))
+        lss.append(load_labels(dataset, version, f"{workload}_{i}"))
+    queryset = {k: QueryArray.concat([qs[k] for qs in qss]) for k in ('train', 'valid', 'test')}
+    labels = {k: LabelArray.concat([ls[k] for ls in lss]) for k in ('train', 'valid', 'test')}
 
     for k in queryset.keys():
         L.info(f"Final queryset has {len(queryset[k])} queries with {len(labels[k])} labels")
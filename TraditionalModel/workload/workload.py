@@ -1,7 +1,11 @@
 import csv
+import json
 from collections import OrderedDict
+from pathlib import Path
 from typing import Dict, NamedTuple, Optional, Tuple, List, Any
 import pickle
+import hashlib
+import numbers
 import numpy as np
 
 from ..dtypes import is_categorical
@@ -17,8 +21,217 @@ class Label(NamedTuple):
     cardinality: int
     selectivity: float
 
+# operators of the columnar workload format, op code is the index, -1 for no predicate
+OP_CODES = ['=', '>=', '<=', '[]', '>', '<']
+
+class QueryArray(object):
+    """queries in columnar arrays, Query objects are only materialized on access
+    op: (query, column) op codes, see OP_CODES
+    low/high: literals of each column, low for =, >=, > and [], high for <=, < and []
+    """
+    def __init__(self, columns: List[str], op: np.ndarray, low: List[np.ndarray], high: List[np.ndarray], ncols: np.ndarray) -> None:
+        self.columns = columns
+        self.op = op
+        self.low = low
+        self.high = high
+        self.ncols = ncols
+
+    @property
+    def mask(self) -> np.ndarray:
+        """(query, column) mask of columns having a predicate"""
+        return self.op >= 0
+
+    @classmethod
+    def from_queries(cls, queries: List[Query], columns: Optional[List[str]]=None) -> 'QueryArray':
+        if columns is None:
+            columns = list(queries[0].predicates.keys()) if len(queries) > 0 else []
+        col_ids = {c: j for j, c in enumerate(columns)}
+        op = np.full((len(queries), len(columns)), -1, dtype=np.int8)
+        lows = [[None] * len(queries) for _ in columns]
+        highs = [[None] * len(queries) for _ in columns]
+        for i, q in enumerate(queries):
+            for c, p in q.predicates.items():
+                if p is None:
+                    continue
+                j = col_ids[c]
+                op[i, j] = OP_CODES.index(p[0])
+                if p[0] == '[]':
+                    lows[j][i], highs[j][i] = p[1]
+                elif p[0] in ('<=', '<'):
+                    highs[j][i] = p[1]
+                else:
+                    lows[j][i] = p[1]
+
+        def to_array(vals, other):
+            # slots without literal take one of the column so that the dtype follows the literals
+            fill = next((v for v in vals + other if v is not None), 0.0)
+            vals = [fill if v is None else v for v in vals]
+            # numpy would turn NaN into the string 'nan' next to string literals
+            if any(not isinstance(v, (numbers.Number, np.number, np.datetime64)) for v in vals):
+                return np.array(vals, dtype=object)
+            return np.array(vals)
+        low = [to_array(lows[j], highs[j]) for j in range(len(columns))]
+        high = [to_array(highs[j], lows[j]) for j in range(len(columns))]
+        return cls(columns, op, low, high, np.array([q.ncols for q in queries], dtype=np.int64))
+
+    @classmethod
+    def concat(cls, arrays: List['QueryArray']) -> 'QueryArray':
+        arrays = [as_query_array(a) for a in arrays]
+        columns = arrays[0].columns
+        assert all(a.columns == columns for a in arrays), "queries are on different columns"
+        return cls(columns, np.concatenate([a.op for a in arrays]),
+                   [np.concatenate([a.low[j] for a in arrays]) for j in range(len(columns))],
+                   [np.concatenate([a.high[j] for a in arrays]) for j in range(len(columns))],
+                   np.concatenate([a.ncols for a in arrays]))
+
+    def __len__(self) -> int:
+        return len(self.op)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.query(i)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.query(key)
+        # slices and index arrays give a subset of queries
+        return QueryArray(self.columns, self.op[key], [l[key] for l in self.low], [h[key] for h in self.high], self.ncols[key])
+
+    def query(self, i: int) -> Query:
+        predicates = OrderedDict.fromkeys(self.columns, None)
+        for j in np.flatnonzero(self.op[i] >= 0):
+            op = OP_CODES[self.op[i, j]]
+            if op == '[]':
+                predicates[self.columns[j]] = (op, (self.low[j][i], self.high[j][i]))
+            elif op in ('<=', '<'):
+                predicates[self.columns[j]] = (op, self.high[j][i])
+            else:
+                predicates[self.columns[j]] = (op, self.low[j][i])
+        return Query(predicates=predicates, ncols=int(self.ncols[i]))
+
+    def literals(self, j: int, op: str, qids: np.ndarray) -> Any:
+        """literals of predicates on column j with the operator, a pair of arrays for []"""
+        if op == '[]':
+            return self.low[j][qids], self.high[j][qids]
+        return self.high[j][qids] if op in ('<=', '<') else self.low[j][qids]
+
+    def predicate_groups(self):
+        """yield (column index, operator, query ids) of predicates grouped by column and operator"""
+        for j in range(len(self.columns)):
+            for code in np.unique(self.op[:, j]):
+                if code >= 0:
+                    yield j, OP_CODES[code], np.flatnonzero(self.op[:, j] == code)
+
+    def code_ranges(self, table: Table) -> Tuple[np.ndarray, np.ndarray]:
+        """(query, column) [low, high) code ranges of predicates, see Column.code_range, all codes for no predicate"""
+        lows = np.zeros(self.op.shape, dtype=np.int64)
+        highs = np.tile(np.array([table.columns[c].vocab_size for c in self.columns], dtype=np.int64), (len(self), 1))
+        for j, op, qids in self.predicate_groups():
+            lows[qids, j], highs[qids, j] = table.columns[self.columns[j]].code_ranges(op, self.literals(j, op, qids))
+        return lows, highs
+
+    def ranges(self, table: Table) -> List[Optional[List[Tuple[str, int, int]]]]:
+        """same as query_2_ranges of each query"""
+        lows, highs = self.code_ranges(table)
+        empty = (lows >= highs).any(axis=1)
+        sizes = np.array([table.columns[c].vocab_size for c in self.columns], dtype=np.int64)
+        effective = ~((lows == 0) & (highs == sizes)) & ~empty[:, None]
+        ranges = [None if e else [] for e in empty]
+        for i, j in zip(*np.nonzero(effective)):
+            ranges[i].append((self.columns[j], int(lows[i, j]), int(highs[i, j])))
+        return ranges
+
+def queries_2_ranges(queries: Any, table: Table) -> List[Optional[List[Tuple[str, int, int]]]]:
+    """query_2_ranges of each query, computed on columnar queries"""
+    return as_query_array(queries, list(table.columns.keys())).ranges(table)
+
+class Sharded(object):
+    """queries (or labels) of a group stored in shard files, iterating only keeps one shard in memory
+    use shards() to process them in bounded memory, to_array() concatenates all of them
+    """
+    def __init__(self, files: List[Path], nums: List[int], group: str, read: Any=None) -> None:
+        self.files = files
+        self.nums = nums
+        self.group = group
+        self.read = read or read_queryset
+        self.offsets = np.concatenate(([0], np.cumsum(nums))).astype(np.int64)
+        self._shard = (None, None)
+
+    def shard(self, i: int) -> Any:
+        if self._shard[0] != i:
+            self._shard = (i, self.read(self.files[i])[self.group])
+        return self._shard[1]
+
+    def shards(self):
+        for i in range(len(self.files)):
+            yield self.shard(i)
+
+    def to_array(self) -> Any:
+        """all shards concatenated, not kept around"""
+        shards = [self.read(f)[self.group] for f in self.files]
+        return type(shards[0]).concat(shards)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __iter__(self):
+        for shard in self.shards():
+            yield from shard
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            i = int(np.searchsorted(self.offsets, key, side='right')) - 1
+            return self.shard(i)[int(key - self.offsets[i])]
+        return self.to_array()[key]
+
+def as_query_array(queries: Any, columns: Optional[List[str]]=None) -> QueryArray:
+    if isinstance(queries, Sharded):
+        return queries.to_array()
+    return queries if isinstance(queries, QueryArray) else QueryArray.from_queries(queries, columns)
+
+def take(queries: Any, ids: List[int]) -> Any:
+    return queries[np.asarray(ids, dtype=np.int64)] if isinstance(queries, QueryArray) else [queries[i] for i in ids]
+
+class LabelArray(object):
+    """labels in two arrays, Label objects are only materialized on access"""
+    def __init__(self, cardinality: np.ndarray, selectivity: np.ndarray) -> None:
+        self.cardinality = cardinality
+        self.selectivity = selectivity
+
+    @classmethod
+    def from_labels(cls, labels: List[Label]) -> 'LabelArray':
+        if isinstance(labels, Sharded):
+            return labels.to_array()
+        if isinstance(labels, LabelArray):
+            return labels
+        return cls(np.array([l.cardinality for l in labels], dtype=np.int64),
+                   np.array([l.selectivity for l in labels], dtype=np.float64))
+
+    @classmethod
+    def concat(cls, arrays: List['LabelArray']) -> 'LabelArray':
+        arrays = [cls.from_labels(a) for a in arrays]
+        return cls(np.concatenate([a.cardinality for a in arrays]), np.concatenate([a.selectivity for a in arrays]))
+
+    def __len__(self) -> int:
+        return len(self.cardinality)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Label(cardinality=int(self.cardinality[key]), selectivity=float(self.selectivity[key]))
+        return LabelArray(self.cardinality[key], self.selectivity[key])
+
+def label_cardinality(labels: Any) -> np.ndarray:
+    """cardinality of all labels, read one shard at a time for a sharded workload"""
+    if isinstance(labels, Sharded):
+        return np.concatenate([shard.cardinality for shard in labels.shards()])
+    return LabelArray.from_labels(labels).cardinality
+
 def new_query(table: Table, ncols) -> Query:
-    return Query(predicates=OrderedDict.fromkeys(table.data.columns, None),
+    return Query(predicates=OrderedDict.fromkeys(table.columns.keys(), None),
                  ncols=ncols)
 
 def query_2_triple(query: Query, with_none: bool=True, split_range: bool=False
@@ -46,13 +259,29 @@ def query_2_triple(query: Query, with_none: bool=True, split_range: bool=False
             vals.append(None)
     return cols, ops, vals
 
+def query_2_ranges(query: Query, table: Table) -> Optional[List[Tuple[str, int, int]]]:
+    """return [low, high) code range of each effective predicate, None if the query is empty for sure"""
+    ranges = []
+    for c, p in query.predicates.items():
+        if p is None:
+            continue
+        col = table.columns[c]
+        low, high = col.code_range(*p)
+        if low >= high:
+            return None
+        # predicate covers all codes (including NaN), no need to check
+        if low == 0 and high == col.vocab_size:
+            continue
+        ranges.append((c, low, high))
+    return ranges
+
 def query_2_sql(query: Query, table: Table, aggregate=True, split=False, dbms='postgres'):
     preds = []
     for col, pred in query.predicates.items():
         if pred is None:
             continue
         op, val = pred
-        if is_categorical(table.data[col].dtype):
+        if is_categorical(table.columns[col].dtype):
             val = f"\'{val}\'" if not isinstance(val, tuple) else tuple(f"\'{v}\'" for v in val)
         if op == '[]':
             if split:
@@ -73,7 +302,7 @@ def query_2_kde_sql(query: Query, table: Table):
         if pred is None:
             continue
         op, val = pred
-        if is_categorical(table.data[col].dtype):
+        if is_categorical(table.columns[col].dtype):
             assert op =='=' and not isinstance(val, tuple), val
             val = table.columns[col].discretize(val).item()
         if op == '[]':
@@ -110,7 +339,7 @@ def query_2_sqls(query: Query, table: Table):
         if pred is None:
             continue
         op, val = pred
-        if is_categorical(table.data[col].dtype):
+        if is_categorical(table.columns[col].dtype):
             val = f"\'{val}\'" if not isinstance(val, tuple) else tuple(f"\'{v}\'" for v in val)
 
         if op == '[]':
@@ -139,6 +368,32 @@ def query_2_vector(query: Query, table: Table, upper: int=1):
             raise NotImplementedError
     return np.array(vec) * upper
 
+def normalize_literals(col: Any, vals: np.ndarray) -> np.ndarray:
+    """Column.normalize over literals with the precision it has on a single literal, i.e. computed in float64"""
+    if is_categorical(col.dtype) or col.minval >= col.maxval:
+        return col.normalize(vals)
+    vals = np.asarray(vals, dtype=np.float32).astype(np.float64)
+    return ((vals - col.minval) / (col.maxval - col.minval)).astype(np.float32)
+
+def queries_2_vectors(queries: Any, table: Table, upper: int=1) -> np.ndarray:
+    """same as stacking query_2_vector of each query (in float32), computed on columnar queries"""
+    queries = as_query_array(queries, list(table.columns.keys()))
+    vecs = np.tile(np.array([0.0, 1.0], dtype=np.float32), (len(queries), len(queries.columns)))
+    for j, op, qids in queries.predicate_groups():
+        col = table.columns[queries.columns[j]]
+        vals = queries.literals(j, op, qids)
+        if op == '[]':
+            vecs[qids, 2*j], vecs[qids, 2*j+1] = normalize_literals(col, vals[0]), normalize_literals(col, vals[1])
+        elif op == '>=':
+            vecs[qids, 2*j] = normalize_literals(col, vals)
+        elif op == '<=':
+            vecs[qids, 2*j+1] = normalize_literals(col, vals)
+        elif op == '=':
+            vecs[qids, 2*j] = vecs[qids, 2*j+1] = normalize_literals(col, vals)
+        else:
+            raise NotImplementedError
+    return vecs * np.float32(upper)
+
 def query_2_quicksel_vector(query: Query, table: Table, discrete_cols=set()):
     vec = []
     for col_name, pred in query.predicates.items():
@@ -191,27 +446,199 @@ def query_2_quicksel_vector(query: Query, table: Table, discrete_cols=set()):
                 raise NotImplementedError
     return np.array(vec)
 
+def queries_2_quicksel_vectors(queries: Any, table: Table, discrete_cols=set()) -> np.ndarray:
+    """same as stacking query_2_quicksel_vector of each query, computed on columnar queries"""
+    queries = as_query_array(queries, list(table.columns.keys()))
+    vecs = np.tile(np.array([0.0, 1.0]), (len(queries), len(queries.columns)))
+    for j, op, qids in queries.predicate_groups():
+        col = table.columns[queries.columns[j]]
+        vals = queries.literals(j, op, qids)
+
+        # adjust predicate to a proper range for discrete columns
+        if col.name in discrete_cols:
+            if is_categorical(col.dtype):
+                vals = tuple(col.discretize(v) for v in vals) if op == '[]' else col.discretize(vals)
+                minval = 0
+                maxval = col.vocab_size
+                vocab = np.arange(col.vocab_size)
+            else: # integer values
+                minval = col.minval
+                maxval = col.maxval + 1
+                vocab = col.vocab[1:] if col.has_nan else col.vocab
+
+            if op == '=':
+                vals = (vals, vals)
+            elif op == '>=':
+                vals = (vals, np.full(len(qids), maxval))
+            elif op == '<=':
+                vals = (np.full(len(qids), minval), vals)
+            else:
+                assert op == '[]'
+
+            # smallest value >= val0 and smallest value > val1, maxval if there is no such value
+            vocab = np.append(vocab, maxval)
+            val0 = np.where(vals[0] < maxval, vocab[np.minimum(np.searchsorted(vocab, vals[0], side='left'), len(vocab)-1)], maxval)
+            val1 = np.where(vals[1] < maxval, vocab[np.minimum(np.searchsorted(vocab, vals[1], side='right'), len(vocab)-1)], maxval)
+            assert (val0 <= val1).all(), (val0, val1)
+            assert ((val0 >= minval) & (val0 <= maxval)).all(), (val0, minval, maxval)
+            assert ((val1 >= minval) & (val1 <= maxval)).all(), (val1, minval, maxval)
+            # normalize to [0, 1]
+            vecs[qids, 2*j] = (val0-minval)/(maxval-minval)
+            vecs[qids, 2*j+1] = (val1-minval)/(maxval-minval)
+
+        # directly normalize continous columns
+        elif op == '>=':
+            vecs[qids, 2*j] = normalize_literals(col, vals)
+        elif op == '<=':
+            vecs[qids, 2*j+1] = normalize_literals(col, vals)
+        elif op == '[]':
+            vecs[qids, 2*j], vecs[qids, 2*j+1] = normalize_literals(col, vals[0]), normalize_literals(col, vals[1])
+        else:
+            raise NotImplementedError
+    return vecs
+
+# batch encoders of load_features
+ENCODERS = {
+    'vector': queries_2_vectors,
+    'quicksel': queries_2_quicksel_vectors,
+}
+
+def load_features(table: Table, workload: str, encoder: str, **kwargs: Any) -> Dict[str, np.ndarray]:
+    """encoded matrix of each group of the workload, cached per (workload, table version and vocab, encoder and its params)"""
+    query_path = DATA_ROOT / table.dataset / "workload"
+    params = sorted((k, sorted(v) if isinstance(v, set) else v) for k, v in kwargs.items())
+    # encoders only depend on the vocab of the table, a rebuilt table with another vocab gets new features
+    params = hashlib.md5(repr((params, [col.vocab_digest() for col in table.columns.values()])).encode()).hexdigest()[:8]
+    feature_path = query_path / "features" / f"{workload}-{table.version}-{encoder}-{params}.npz"
+    # the manifest of a sharded workload is written after all of its shards
+    source_path = shard_dir(table.dataset, workload) / "manifest.json"
+    if not source_path.is_file():
+        source_path = query_path / f"{workload}.npz"
+    if not source_path.is_file():
+        source_path = query_path / f"{workload}.pkl"
+    # regenerated workloads invalidate the features
+    if feature_path.is_file() and feature_path.stat().st_mtime >= source_path.stat().st_mtime:
+        with np.load(feature_path) as features:
+            return {group: features[group] for group in features.files}
+
+    features = {}
+    for group, queries in load_queryset(table.dataset, workload).items():
+        # sharded workloads are encoded one shard at a time
+        shards = queries.shards() if isinstance(queries, Sharded) else [queries]
+        features[group] = np.concatenate([ENCODERS[encoder](shard, table, **kwargs) for shard in shards])
+    feature_path.parent.mkdir(exist_ok=True)
+    np.savez(feature_path, **features)
+    return features
+
+def save_queryset(path: Path, queryset: Dict[str, List[Query]]) -> None:
+    columns = next((list(q.columns) if isinstance(q, QueryArray) else list(q[0].predicates.keys())
+                    for q in queryset.values() if len(q) > 0), [])
+    arrays = {'columns': np.array(columns)}
+    for group, queries in queryset.items():
+        queries = as_query_array(queries, columns)
+        arrays[f"{group}.op"] = queries.op
+        arrays[f"{group}.ncols"] = queries.ncols
+        for j in range(len(queries.columns)):
+            arrays[f"{group}.low.{j}"] = queries.low[j]
+            arrays[f"{group}.high.{j}"] = queries.high[j]
+    np.savez(path, **arrays)
+
+def read_queryset(path: Path) -> Dict[str, QueryArray]:
+    # literals of categorical columns might be objects
+    with np.load(path, allow_pickle=True) as arrays:
+        columns = arrays['columns'].tolist() if 'columns' in arrays else []
+        groups = [k[:-len('.op')] for k in arrays.files if k.endswith('.op')]
+        return {group: QueryArray(columns, arrays[f"{group}.op"],
+                                  [arrays[f"{group}.low.{j}"] for j in range(len(columns))],
+                                  [arrays[f"{group}.high.{j}"] for j in range(len(columns))],
+                                  arrays[f"{group}.ncols"])
+                for group in groups}
+
+def save_labels(path: Path, labels: Dict[str, List[Label]]) -> None:
+    arrays = {}
+    for group, ls in labels.items():
+        ls = LabelArray.from_labels(ls)
+        arrays[f"{group}.cardinality"] = ls.cardinality
+        arrays[f"{group}.selectivity"] = ls.selectivity
+    np.savez(path, **arrays)
+
+def read_labels(path: Path) -> Dict[str, LabelArray]:
+    with np.load(path) as arrays:
+        groups = [k[:-len('.cardinality')] for k in arrays.files if k.endswith('.cardinality')]
+        return {group: LabelArray(arrays[f"{group}.cardinality"], arrays[f"{group}.selectivity"]) for group in groups}
+
+def shard_dir(dataset: str, name: str) -> Path:
+    """directory of a workload generated in shards, see generate_workload"""
+    return DATA_ROOT / dataset / "workload" / name
+
+def shard_file(dataset: str, name: str, group: str, shard_id: int, version: Optional[str]=None) -> Path:
+    if version is None:
+        return shard_dir(dataset, name) / f"{group}-{shard_id}.npz"
+    return shard_dir(dataset, name) / f"{group}-{shard_id}-{version}-label.npz"
+
+def load_manifest(dataset: str, name: str) -> Optional[Dict[str, Any]]:
+    """manifest of a sharded workload: seed and number of queries of each shard per group, None if not sharded"""
+    manifest_path = shard_dir(dataset, name) / "manifest.json"
+    if not manifest_path.is_file():
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def dump_manifest(dataset: str, name: str, manifest: Dict[str, Any]) -> None:
+    with open(shard_dir(dataset, name) / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def remove_manifest(dataset: str, name: str) -> None:
+    manifest_path = shard_dir(dataset, name) / "manifest.json"
+    if manifest_path.is_file():
+        manifest_path.unlink()
 
 def dump_queryset(dataset: str, name: str, queryset: Dict[str, List[Query]]) -> None:
     query_path = DATA_ROOT / dataset / "workload"
     query_path.mkdir(exist_ok=True)
-    with open(query_path / f"{name}.pkl", 'wb') as f:
-        pickle.dump(queryset, f, protocol=PKL_PROTO)
+    save_queryset(query_path / f"{name}.npz", queryset)
+    # shards generated before under the same name would take precedence
+    remove_manifest(dataset, name)
 
-def load_queryset(dataset: str, name: str) -> Dict[str, List[Query]]:
+def load_queryset(dataset: str, name: str) -> Dict[str, QueryArray]:
     query_path = DATA_ROOT / dataset / "workload"
-    with open(query_path / f"{name}.pkl", 'rb') as f:
-        return pickle.load(f)
+    manifest = load_manifest(dataset, name)
+    if manifest is not None:
+        return {group: Sharded([shard_file(dataset, name, group, i) for i in range(len(shards))],
+                               [shard['num'] for shard in shards], group)
+                for group, shards in manifest['groups'].items()}
+    if not (query_path / f"{name}.npz").is_file():
+        # workloads pickled as lists of Query
+        with open(query_path / f"{name}.pkl", 'rb') as f:
+            return {group: as_query_array(queries) for group, queries in pickle.load(f).items()}
+    return read_queryset(query_path / f"{name}.npz")
 
 def dump_labels(dataset: str, version: str, name: str, labels: Dict[str, List[Label]]) -> None:
     label_path = DATA_ROOT / dataset / "workload"
-    with open(label_path / f"{name}-{version}-label.pkl", 'wb') as f:
-        pickle.dump(labels, f, protocol=PKL_PROTO)
+    manifest = load_manifest(dataset, name)
+    if manifest is None:
+        save_labels(label_path / f"{name}-{version}-label.npz", labels)
+        return
+    # labels of a sharded workload are split into shards as well
+    for group, ls in labels.items():
+        ls = LabelArray.from_labels(ls)
+        start = 0
+        for i, shard in enumerate(manifest['groups'][group]):
+            save_labels(shard_file(dataset, name, group, i, version), {group: ls[start:start+shard['num']]})
+            start += shard['num']
 
-def load_labels(dataset: str, version: str, name: str) -> Dict[str, List[Label]]:
+def load_labels(dataset: str, version: str, name: str) -> Dict[str, LabelArray]:
     label_path = DATA_ROOT / dataset / "workload"
-    with open(label_path / f"{name}-{version}-label.pkl", 'rb') as f:
-        return pickle.load(f)
+    manifest = load_manifest(dataset, name)
+    if manifest is not None:
+        return {group: Sharded([shard_file(dataset, name, group, i, version) for i in range(len(shards))],
+                               [shard['num'] for shard in shards], group, read=read_labels)
+                for group, shards in manifest['groups'].items()}
+    if not (label_path / f"{name}-{version}-label.npz").is_file():
+        # labels pickled as lists of Label
+        with open(label_path / f"{name}-{version}-label.pkl", 'rb') as f:
+            return {group: LabelArray.from_labels(ls) for group, ls in pickle.load(f).items()}
+    return read_labels(label_path / f"{name}-{version}-label.npz")
 
 def dump_sqls(dataset: str, version: str, workload: str, group: str='test'):
     table = load_table(dataset, version)